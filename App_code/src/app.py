@@ -1,58 +1,112 @@
+import config
+from timing import record, startup_report, timed, START
+
+# command line options override the environment (see config.py)
+if __name__ == "__main__":
+    config.parse_args()
+
 # plotly dash libraries
-from dash import Dash, dcc, html, dash_table, Input, Output, State, callback, MATCH, ALL, no_update, ctx
+from dash import ClientsideFunction, Dash, DiskcacheManager, Patch, clientside_callback, dcc, html, dash_table, Input, Output, State, callback, hooks, no_update
 from dash.exceptions import PreventUpdate
+from flask import Response, abort, g, request, send_file, stream_with_context
 import dash_bootstrap_components as dbc
 
-# libraries for graphs
-import plotly.express as px
-from dash_bootstrap_templates import load_figure_template
-load_figure_template(["minty"])
-
 import base64
 import datetime
-import io
+import logging
+import os
+import time
+from functools import lru_cache
 
+import diskcache
 import pandas as pd
 
-# brightway 2.5 libraries
-import bw2analyzer as ba
-import bw2data as bd
-import bw2calc as bc
-import bw2io as bi
-import matrix_utils as mu
-import bw_processing as bp
-
-# bw project setup
-bd.projects.set_current("<name of your project with ecoinvent>") # insert the name of your project
-ei_db = bd.Database("<ecoinvent database name>") 
-bio_db = bd.Database("<biosphere database name>")
-# impact assessment method used for the computation of LCA impacts
-EF_select = [met for met in bd.methods if met[0] == 'EF v3.1']
-
-# list of conversion factors from Aspen to brightway
-conversion_factors = {
-    'kg/hr': 1,  # Assuming kg/hr stays as kg/hr, no conversion needed
-    'l/min': 0.001 * 60 , # Convert l/min to cubic meters per hour (m³/hr)
-    'tonne/year': 1000/(365*24), # Convert tonne/year to kg per hour (kg/hr)
-    'MJ/hr' : 1
-}
-
-# calculate the flow amounts, considering the correct units, for setting up the LCA computation
-def calculate_amount(row, ref_mass_flow):
-    if row['Act unit'] == 'kilogram':
-        return row['Mass Flows'] / ref_mass_flow
-    elif row['Act unit'] == 'cubic meter':
-        return row['Volume Flow'] / ref_mass_flow
-    elif row['Act unit'] == 'megajoule':
-        return row['Duty'] / ref_mass_flow
-    elif row['Act unit'] =='kilowatt hour':
-        return (row['Duty']/3.6) / ref_mass_flow # to convert MJ in kWh
-    else:
-        return 0.0
-    
-app = Dash(__name__, external_stylesheets=[dbc.themes.MINTY, dbc.icons.FONT_AWESOME])
+# brightway is loaded on first use, or in the background by the warm-up (see backend.py)
+import backend
+import metrics
+from aspen_io import read_material_table, read_utility_table
+from pipeline import (
+    MAPPING_COLUMNS, STREAM_TYPES, UTILITY_COLUMNS, activity_kind, apply_mapping, contribution_results, lca_results,
+    lca_setup, mapping_grid, mapping_status, material_streams, node_label, read_sweep_table, results_key,
+    set_stream_type, stream_mapping, stream_results, sweep_results, sweep_setups, utility_streams,
+)
+from catalog import method_unit
+from export import EXPORT_FORMATS, EXPORT_TABLES, csv_chunks, export_file, result_table
+from metrics import instrumented
+from montecarlo import PERCENTILES, monte_carlo
+from units import UnitError
+from watch import diff_message, diff_streams, stream_table
+
+record('import app modules', time.perf_counter() - START)
+
+# graphs: plotly express and the figure template are loaded with the first graph
+@lru_cache(maxsize=None)
+def plotly_express():
+    with timed('import plotly express'):
+        import plotly.express as px
+        from dash_bootstrap_templates import load_figure_template
+        load_figure_template(["minty"])
+    return px
+
+# queries shorter than this are not searched while the user is typing
+MIN_QUERY_LENGTH = 2
+
+# dropdown options for a search, from the in-memory index or from the database while the index is loading
+def search_options(db, query, detail='location'):
+    query = ' '.join(query.split())
+    if len(query) < MIN_QUERY_LENGTH:
+        raise PreventUpdate
+    index = backend.catalog().index(db.name)
+    results = index.search(query) if index is not None else db.search(query, limit=50)
+    return [{'label': f"{item['name']}, {item[detail]}", 'value': item['code']} for item in results]
+
+# data of a dcc.Store kept on the server: a copy of the DataFrame, an empty one if nothing was stored yet.
+# Data that has expired from the store stops the callback
+def stored_frame(key):
+    if key is None:
+        return pd.DataFrame()
+    df = backend.session_store().get(key)
+    if df is None:
+        raise PreventUpdate
+    return df.copy()
+
+# dropdown option and reference product of an activity that is already selected (by a mapping template)
+def selected_options(node, detail='location'):
+    if node is None:
+        return []
+    return [{'label': f"{node['name']}, {node[detail]}", 'value': node['code']}]
+
+def reference_product(node):
+    if node is None:
+        return None
+    return f"Reference product: {node['reference product']}"
+
+# LCA computations run as background jobs in their own processes, which can report progress and be cancelled
+background_manager = DiskcacheManager(diskcache.Cache(os.path.join(backend.work_dir(), 'jobs')))
+
+app = Dash(__name__, external_stylesheets=[dbc.themes.MINTY, dbc.icons.FONT_AWESOME],
+           background_callback_manager=background_manager)
 server = app.server
 
+# metrics of the callbacks and computations, counted together for the server and its jobs (see /metrics)
+metrics.enable(os.path.join(backend.work_dir(), 'metrics'), trace_log=config.TRACE_LOG)
+
+# outputs of each callback request (background ones included), taken from the callback context Dash builds from the
+# request and named as Dash names them (without the suffix of the duplicate outputs), for record_response_size
+@hooks.custom_data('metrics')
+def callback_output(context):
+    outputs = [output for group in context.outputs_list or []
+               for output in (group if isinstance(group, list) else [group])]
+    names = [f"{output['id']}.{output['property']}" for output in outputs]
+    g.callback_output = f"..{'...'.join(names)}.." if len(names) > 1 else ''.join(names)
+
+# size of the callback responses, by output of the callback
+@server.after_request
+def record_response_size(response):
+    if request.path.endswith('/_dash-update-component') and response.content_length is not None:
+        metrics.observe('response_bytes', response.content_length, output=g.get('callback_output'))
+    return response
+
 # app layout
 # materials upload part
 material_jumbotron = dbc.Col(
@@ -102,12 +156,6 @@ material_jumbotron = dbc.Col(
             # dcc.Store(id = 'materials-store'),
             dcc.Store(id = 'input-flows-store'),
             dcc.Store(id = 'output-flows-store'), 
-            html.Br(),
-            dbc.Row(
-                [
-                    html.Div(id = 'output-type-error', children = []),
-                ]
-            ),
         ],
         className="h-100 p-5 text-black border rounded-3",
     ),
@@ -169,6 +217,229 @@ jumbotron = dbc.Row(
     className="align-items-md-stretch",
 )
 
+# exports of the watched folder (see watch.py), looked at by the dashboard every WATCH_INTERVAL seconds
+watch_row = dbc.Row(
+    [
+        dbc.Col(md=2),
+        dbc.Col(
+            [
+                html.I(id='watch-status', children=f'Watching {config.WATCH_DIR} for Aspen exports'),
+                dcc.Interval(id='watch-interval', interval=config.WATCH_INTERVAL * 1000,
+                             disabled=config.WATCH_DIR is None),
+                dcc.Store(id='watch-version'),
+            ], md=8,
+        ),
+    ],
+    style={'display': 'block' if config.WATCH_DIR else 'none'},
+)
+
+# rows of the mapping grid sent to the browser at once
+GRID_PAGE_SIZE = 20
+
+# mapping of the uploaded streams: the whole grid stays on the server (mapping-grid), the table only gets the rows
+# of its page. The activity of the selected row is searched and set in the editor below the table
+mapping_row = html.Div(
+    id='toggle-mapping',
+    children=[
+        dbc.Row(
+            [
+                dbc.Col(md=1),
+                dbc.Col(
+                    [
+                        html.H4('Stream mapping'),
+                        dash_table.DataTable(
+                            id='mapping-table',
+                            columns=[
+                                {'name': 'Stream', 'id': 'Stream Name', 'editable': False},
+                                {'name': 'Kind', 'id': 'Stream', 'editable': False},
+                                {'name': 'Mass flow [kg/hr]', 'id': 'Mass Flows', 'type': 'numeric',
+                                 'format': {'specifier': '.4~g'}, 'editable': False},
+                                {'name': 'Type', 'id': 'Type', 'presentation': 'dropdown', 'editable': True},
+                                {'name': 'Activity', 'id': 'Activity name', 'editable': False},
+                            ],
+                            data=[],
+                            editable=True,
+                            page_action='custom',
+                            page_current=0,
+                            page_size=GRID_PAGE_SIZE,
+                            page_count=0,
+                            dropdown_conditional=[
+                                {
+                                    'if': {'column_id': 'Type', 'filter_query': f'{{Stream}} = "{kind}"'},
+                                    'options': [{'label': stream_type, 'value': stream_type} for stream_type in types],
+                                    'clearable': False,
+                                } for kind, types in STREAM_TYPES.items()
+                            ],
+                            style_cell={'textAlign': 'left', 'whiteSpace': 'normal', 'height': 'auto'},
+                            style_data_conditional=[
+                                {'if': {'filter_query': '{Type} is blank'}, 'backgroundColor': '#fff3cd'},
+                            ],
+                        ),
+                        dcc.Store(id='mapping-grid'),
+                        dcc.Store(id='grid-built'),
+                        dcc.Store(id='grid-row'),
+                        html.Br(),
+                        html.Div(
+                            id='grid-editor',
+                            children=[
+                                html.H5(id='grid-stream'),
+                                dbc.Row(
+                                    [
+                                        dbc.Col(
+                                            dbc.Input(id='grid-search', type='text', placeholder='Search activity', debounce=300),
+                                            md=4,
+                                        ),
+                                        dbc.Col(
+                                            [
+                                                dcc.Dropdown(options=[], id='grid-activity', optionHeight=120),
+                                                html.I(id='grid-activity-name'),
+                                            ], md=8,
+                                        ),
+                                    ]
+                                ),
+                            ],
+                            style={'display': 'none'},
+                        ),
+                    ], md=10,
+                ),
+                dbc.Col(md=1),
+            ],
+            className="align-items-md-stretch",
+        ),
+    ], style={'display': 'none'},
+)
+
+# top contributions of the upstream processes, elementary flows and regions to the selected category,
+# analysed on demand (one more solve of the process with its upstream supply)
+contribution_row = html.Div(
+    id='toggle-contributions',
+    children=[
+        dbc.Row(
+            [
+                dbc.Col(md=3),
+                dbc.Col(
+                    [
+                        html.H5('Contribution analysis'),
+                        html.Button('Analyse the contributions', id='btn-contributions'),
+                        dcc.RadioItems(
+                            options=[
+                                {'label': ' Upstream processes', 'value': 'Process'},
+                                {'label': ' Elementary flows', 'value': 'Elementary flow'},
+                                {'label': ' Regions', 'value': 'Region'},
+                            ],
+                            value='Process',
+                            id='contribution-kind',
+                            inline=True,
+                            inputStyle={'margin-left': '10px'},
+                        ),
+                        dcc.Graph(id='contribution-graph', style={'display': 'none'}),
+                        dcc.Store(id='lca-contributions'),
+                    ], md=6,
+                ),
+                dbc.Col(md=3),
+            ],
+            className="align-items-md-stretch",
+        ),
+    ], style={'display': 'none'},
+)
+
+# parametric sweep: impacts of the mapped process for every case of a table of stream flows
+sweep_row = html.Div(
+    id='toggle-sweep',
+    children=[
+        dbc.Row(
+            [
+                dbc.Col(md=3),
+                dbc.Col(
+                    [
+                        html.H5('Parametric sweep'),
+                        dcc.Upload(
+                            id='upload-sweep',
+                            children=html.Div([
+                                html.A('Select a table of cases'),
+                                html.Br(),
+                                html.I('one row per case, one column per stream with its flow in kg/hr, m3/hr, MJ/hr or kmol/hr'),
+                            ]),
+                            style={'border-width': '2px', 'border-style': 'dashed', 'border-radius': '20px',
+                                   'padding': '10px', 'cursor': 'pointer', 'textAlign': 'center'},
+                        ),
+                        html.Div(id='sweep-message', children=[]),
+                        dcc.Loading(
+                            id='load-sweep',
+                            children=[dcc.Graph(id='sweep-graph', style={'display': 'none'})],
+                            type='graph',
+                        ),
+                        dcc.Store(id='sweep-results'),
+                        html.Button("Download sweep results", id="btn-download-sweep", style={'display':'none'}),
+                        dcc.Download(id="download-sweep"),
+                    ], md=6,
+                ),
+                dbc.Col(md=3),
+            ],
+            className="align-items-md-stretch",
+        ),
+    ], style={'display': 'none'},
+)
+
+# Monte Carlo: distribution of the impacts with the ecoinvent uncertainty and an uncertainty on the Aspen flows
+montecarlo_row = html.Div(
+    id='toggle-montecarlo',
+    children=[
+        dbc.Row(
+            [
+                dbc.Col(md=3),
+                dbc.Col(
+                    [
+                        html.H5('Monte Carlo'),
+                        dbc.Row(
+                            [
+                                dbc.Col([html.I('Iterations'), dbc.Input(id='mc-iterations', type='number', min=10, step=10, value=1000)], md=4),
+                                dbc.Col([html.I('Flow uncertainty (%)'), dbc.Input(id='mc-uncertainty', type='number', min=0, value=10)], md=4),
+                                dbc.Col([html.I('Seed'), dbc.Input(id='mc-seed', type='number', min=0, step=1, value=42)], md=4),
+                            ]
+                        ),
+                        html.Br(),
+                        html.Button('Run Monte Carlo', id='btn-montecarlo'),
+                        html.Button('Cancel', id='cancel-montecarlo', style={'display': 'none'}),
+                        dbc.Progress(id='mc-progress', value=0, striped=True, animated=True, style={'display': 'none'}),
+                        html.Div(id='mc-summary', children=[]),
+                        dcc.Graph(id='mc-graph', style={'display': 'none'}),
+                    ], md=6,
+                ),
+                dbc.Col(md=3),
+            ],
+            className="align-items-md-stretch",
+        ),
+    ], style={'display': 'none'},
+)
+
+# mapping templates: the selected template maps the streams of the next uploads
+template_row = dbc.Row(
+    [
+        dbc.Col(md=2),
+        dbc.Col(
+            [
+                html.H5('Mapping template'),
+                dcc.Dropdown(options=[], id='mapping-template', placeholder='Apply a saved mapping to the uploads'),
+            ], md=4,
+        ),
+        dbc.Col(
+            [
+                html.H5('Save the mapping as template'),
+                dbc.Input(id='template-name', type='text', placeholder='Template name'),
+            ], md=3,
+        ),
+        dbc.Col(
+            [
+                html.Br(),
+                html.Button('Save template', id='btn-save-template'),
+                html.I(id='template-saved'),
+            ], md=3,
+        ),
+    ],
+    className="align-items-md-stretch",
+)
+
 app.layout = dbc.Container(
     [
         html.Br(),
@@ -215,18 +486,40 @@ app.layout = dbc.Container(
         ),
         html.Br(),
         jumbotron,  
+        html.Br(),
+        watch_row,
+        template_row,
+        html.Br(),
+        mapping_row,
         dcc.Store(id ='lca-setup'),
+        dcc.Store(id ='lca-pending'),
+        dcc.Store(id ='stream-mapping'),
         html.Br(),
         html.Div(
             id='toggle-category',
             children=[
+                # the LCA setup is built when the mapping is complete and the button is pressed
+                dbc.Row(
+                    [
+                        dbc.Col(md=3),
+                        dbc.Col(
+                            [
+                                html.Button('Compute LCA', id='btn-compute', disabled=True),
+                                html.I(id='mapping-status', children=[]),
+                            ], md=6,
+                        ),
+                        dbc.Col(md=3),
+                    ],
+                    className="align-items-md-stretch",
+                ),
+                html.Br(),
                 dbc.Row(
                     [
                         dbc.Col(md=3),
                         dbc.Col(
                             [
                                 html.H5('Select impact category'),
-                                dcc.Dropdown(options = [{'label': EF_select[i][1], 'value': EF_select[i][1]} for i in range(len(EF_select))],
+                                dcc.Dropdown(options = [],
                                             id = 'impact-category',)
                             ],md=6,
                         ),
@@ -264,7 +557,13 @@ app.layout = dbc.Container(
                         ),
                     ],md=4
                 ),
-                dbc.Col(md=3),
+                dbc.Col(
+                    [
+                        dbc.Progress(id='lca-progress', value=0, striped=True, animated=True, style={'display': 'none'}),
+                        html.Br(),
+                        html.Button("Cancel", id="cancel-lca", style={'display': 'none'}),
+                    ],
+                    md=3),
             ],
             # justify="center", 
             # align="center", 
@@ -276,21 +575,40 @@ app.layout = dbc.Container(
                 dbc.Col(md=5),
                 dbc.Col(
                     [
-                        dcc.Store(id='lca-results'),
-                        html.Button("Download results", id="btn-download", style={'display':'none'}),
-                        dcc.Download(id="download-lcia"),
+                        # exports written by the server from the cached results (see the /export route)
+                        html.Div(
+                            [
+                                html.Span("Download results: "),
+                                html.A("streams (CSV)", id='export-streams-csv'),
+                                " | ",
+                                html.A("streams (Parquet)", id='export-streams-parquet'),
+                                " | ",
+                                html.A("contributions (CSV)", id='export-contributions-csv'),
+                                html.Br(),
+                                html.Button("Prepare Excel workbook", id="btn-export-excel"),
+                                html.Div(id='export-excel-link'),
+                            ],
+                            id='export-links',
+                            style={'display': 'none'},
+                        ),
                     ], md = 4,
                 ),                        
                 dbc.Col(md=3),
             ]
         ),
         html.Br(),
+        contribution_row,
+        html.Br(),
+        sweep_row,
+        html.Br(),
+        montecarlo_row,
+        html.Br(),
     ],
     fluid=True,
 )
 
     
-# Upload materials export from Aspen
+# Upload materials export from Aspen: the streams are mapped in the grid below the uploads
 @callback(
     Output('material-data-upload', 'children'),
     Output('input-flows-store', 'data'),
@@ -301,6 +619,7 @@ app.layout = dbc.Container(
     State('upload-material', 'last_modified'),
     prevent_initial_call=True,
 )
+@instrumented
 def materials_upload(content, filename, date):
     if content is None:
         return html.Div(), None, None, None
@@ -309,671 +628,793 @@ def materials_upload(content, filename, date):
 
     try:
         decoded = base64.b64decode(content_string)
-        if 'xlsx' in filename:
-            material_df = pd.read_excel(io.BytesIO(decoded), skiprows=3, sheet_name='Material').iloc[:,2:]
-            
+        # only the From, To, Mass Flows and Volume Flow rows are read, one row per stream
+        material = read_material_table(decoded, filename)
 
-            if not material_df.empty:
-                material_df_t = material_df.set_index('Stream Name').T
+        if not material.flows.empty:
+            # flows in kg/hr, m3/hr and kmol/hr
+            in_df_reset, out_df_reset = material_streams(material)
 
-                # Filter the columns based on the conditions
-                outputs = (material_df_t['From'].notna()) & (material_df_t['To'].isna())
-                output_df_t = material_df_t.loc[outputs,:]
-                inputs = (material_df_t['From'].isna()) & (material_df_t['To'].notna())
-                input_df_t = material_df_t.loc[inputs,:]
+            children = [
+                html.H5(f'Uploaded file: {filename}'),
+                html.I(f'{len(in_df_reset)} input and {len(out_df_reset)} output streams'),
+            ]
 
-                # Transpose back to the original format
-                output_tot_df = output_df_t.T.reset_index()
-                output_df=pd.concat([output_tot_df.loc[(output_tot_df['Stream Name']=='Mass Flows')].iloc[[0]], output_tot_df.loc[(output_tot_df['Stream Name']=='Volume Flow')].iloc[[0]]]).reset_index(drop=True)
-                input_tot_df = input_df_t.T.reset_index()
-                input_df=pd.concat([input_tot_df.loc[(input_tot_df['Stream Name']=='Mass Flows')].iloc[[0]], input_tot_df.loc[(input_tot_df['Stream Name']=='Volume Flow')].iloc[[0]]]).reset_index(drop=True)
-            
-                unit_df = pd.concat([material_df.loc[(material_df['Stream Name']=='Mass Flows')].iloc[[0]], material_df.loc[(material_df['Stream Name']=='Volume Flow')].iloc[[0]]])[['Stream Name', 'Units']].reset_index(drop=True)
-                
+            style = {'display': 'block'}
 
+            # the flows stay on the server, the stores only get their keys
+            input_data = backend.session_store().put(in_df_reset)
+            output_data = backend.session_store().put(out_df_reset)
 
-                children = [html.H5(f'Uploaded file: {filename}'), html.Br(), html.H2('Input flows:'),] + [
-                    html.Div(
-                        children=[
-                            html.Br(),
-                            dbc.Row(
-                                [
-                                    dbc.Col(
-                                        [
-                                            html.H4(f'{input_df.columns[i]}', id={'type': 'input-name', 'index': i}),
-                                            dbc.RadioItems(
-                                                id = {'type':"flow-type-input",'index': i},
-                                                options=[
-                                                    {'label': 'Technosphere', 'value': 'Technosphere'},
-                                                    {'label': 'Biosphere', 'value': 'Biosphere'},
-                                                    {'label': 'No impact', 'value': 'No impact'}
-                                                ],
-                                                style={'columnCount': 1},
-                                            ),
-                                            html.Br(),
-                                        ], md=3,
-                                    ),
-                                    dbc.Col(
-                                        [
-                                            html.Div(
-                                                children=[],
-                                                id={'type': 'input-element', 'index': i},
-                                            ),
-                                        ], md=9,
-                                    ),
-                                ],
-                                className="align-items-md-stretch",
-                            ),
-                        ]
-                    ) for i in range(1, len(input_df.columns))
-                ] + [html.Br(), html.H2('Output flows:')] + [
-                    html.Div(
-                        children=[
-                            html.Br(),
-                            dbc.Row(
-                                [
-                                    dbc.Col(
-                                        [
-                                            html.H4(f'{output_df.columns[j]}', id={'type': 'output-name', 'index': j}),
-                                            # html.Br(),
-                                            dcc.RadioItems(
-                                                id={'type': 'output-type', 'index': j},
-                                                options=[
-                                                    {'label': 'Reference flow', 'value': 'Reference flow'},
-                                                    {'label': 'Waste flow', 'value': 'Waste flow'},
-                                                    {'label': 'By-product', 'value': 'By-product'},
-                                                    {'label': 'Biosphere flow', 'value': 'Biosphere flow'},
-                                                ],
-                                                style={'columnCount': 1},
-                                            ),
-                                        ], md=3,
-                                    ),
-                                    dbc.Col(
-                                        [
-                                            html.Div(
-                                                children=[],
-                                                id={'type': 'output-element', 'index': j},
-                                            ),
-                                        ], md=9,
-                                    ),
-                                ],
-                                className="align-items-md-stretch",
-                            ),
-                        ]
-                    ) for j in range(1, len(output_df.columns))
-                ]
+            return children, input_data, output_data,  style
+
+    except UnitError as e:
+        return html.Div([f'There was an error processing this file: {e}']), None, None, {'display': 'None'}
+    except Exception as e:
+        print(e)
+        return html.Div(['There was an error processing this file. Upload an Aspen export as .xlsx, .csv or .parquet file']), None, None, {'display': 'None'}
 
-                style = {'display': 'block'}
+# Utility element
+@callback(Output('utility-data-upload', 'children'),
+          Output('utilities-store', 'data'),
+          Output('toggle-category', 'style', allow_duplicate=True),
+              Input('upload-utility', 'contents'),
+              State('upload-utility', 'filename'),
+              State('upload-utility', 'last_modified'),
+              prevent_initial_call=True,
+              ) 
 
-                in_df = input_df.set_index('Stream Name').T
-                in_df_reset = in_df.reset_index()
-                out_df = output_df.set_index('Stream Name').T
-                out_df_reset = out_df.reset_index()
+@instrumented
+def utility_upload(content, filename, date):
+    content_type, content_string = content.split(',')
+
+
+    try:
+        decoded = base64.b64decode(content_string)
+        # only the Utility type, Ultimate fuel source, Mass flow and Duty rows are read, one row per utility
+        utility = read_utility_table(decoded, filename)
+        utility_df = utility.flows
 
-                mass_unit = unit_df[unit_df['Stream Name'] == 'Mass Flows']['Units'].values[0]
-                volume_unit = unit_df[unit_df['Stream Name'] == 'Volume Flow']['Units'].values[0]
+        if not utility_df.empty:
+            children = [html.H5(f'Uploaded file: {filename}'), html.I(f'{len(utility_df)} utilities')]
+            style = {'display': 'block'}
 
-                in_df_reset['Mass Flows'] = in_df_reset['Mass Flows'] * conversion_factors[mass_unit]
-                in_df_reset['Volume Flow'] = in_df_reset['Volume Flow'] * conversion_factors[volume_unit]
-                out_df_reset['Mass Flows'] = out_df_reset['Mass Flows'] * conversion_factors[mass_unit]
-                out_df_reset['Volume Flow'] = out_df_reset['Volume Flow'] * conversion_factors[volume_unit]
+            # mass flows in kg/hr and duties in MJ/hr
+            util_df_reset = utility_streams(utility)
 
-                input_data = in_df_reset.to_dict("records")
-                output_data = out_df_reset.to_dict("records") #dfff.to_dict("records")
+            return children, backend.session_store().put(util_df_reset), style
+        
+        else:
+            children = [
+                html.Div([
+                    html.H5(f'Uploaded file: {filename}'),
+                    html.Div("The utility sheet is empty, select another file")
 
-                return children, input_data, output_data,  style
+                ])
+            ]
+            style = {'display': 'None'}
+            utlity_data = None
+            
+            return children, utlity_data, style
 
+    except UnitError as e:
+        return html.Div([f'There was an error processing this file: {e}']), None, {'display': 'None'}
     except Exception as e:
         print(e)
-        return html.Div(['There was an error processing this file. Upload only .xlsx file']), None, None, {'display': 'None'}
+        return html.Div([
+            'There was an error processing this file. Upload an Aspen export as .xlsx, .csv or .parquet file'
+        ]), None, {'display': 'None'}
+
+# streams of the uploads, or an empty table before the upload
+def uploaded_frame(key, columns):
+    return stored_frame(key) if key is not None else pd.DataFrame(columns=columns)
 
-# Load input element in the layout
-@callback(Output({'type':'input-element', 'index':MATCH}, 'children'),
-              Input({'type': 'flow-type-input', 'index': MATCH}, 'value'),
-              prevent_initial_call=True) 
+# mapping grid of the uploaded streams, kept on the server. The mapping of the streams already in the grid is kept,
+# the other streams take the type and activity they have in the selected template (activities whose unit changed since
+# the template was saved are left to select again). grid-built only changes here, so
+# that the edits of the grid (new keys of mapping-grid) patch the page instead of sending it again.
+# The impact categories come with the first grid, so that listing them costs no round-trip of its own
+@callback(
+    Output('mapping-grid', 'data'),
+    Output('grid-built', 'data'),
+    Output('mapping-table', 'page_current'),
+    Output('toggle-mapping', 'style'),
+    Output('btn-compute', 'disabled'),
+    Output('mapping-status', 'children'),
+    Output('impact-category', 'options'),
+    Input('input-flows-store', 'data'),
+    Input('output-flows-store', 'data'),
+    Input('utilities-store', 'data'),
+    State('mapping-template', 'value'),
+    State('mapping-grid', 'data'),
+    State('impact-category', 'options'),
+    prevent_initial_call=True
+)
 
-def input_element(type):
-    if type is None:
+@instrumented
+def build_grid(in_data, out_data, util_data, template, grid_data, category_options):
+    mapping = backend.template_store().load(template) if template else None
+    previous = backend.session_store().get(grid_data)
+    if previous is not None:
+        previous = previous[MAPPING_COLUMNS]
+        mapping = previous if mapping is None else pd.concat([mapping, previous])
+    try:
+        nodes = backend.catalog().resolve(mapping['Activity'].dropna()) if mapping is not None else {}
+    except KeyError:
+        # activities that are not in the databases any more are left to select
+        nodes = {}
+    grid = mapping_grid(
+        uploaded_frame(in_data, ['Stream Name', 'Mass Flows']),
+        uploaded_frame(out_data, ['Stream Name', 'Mass Flows']),
+        uploaded_frame(util_data, UTILITY_COLUMNS),
+        mapping, nodes,
+    )
+    complete, message = mapping_status(grid)
+    options = no_update if category_options else [{'label': met[1], 'value': met[1]} for met in backend.methods()]
+    key = backend.session_store().put(grid)
+    return key, key, 0, {'display': 'block' if len(grid) else 'none'}, not complete, message, options
+
+# rows of the current page of the grid: the browser only gets the rows it shows
+@callback(
+    Output('mapping-table', 'data'),
+    Output('mapping-table', 'page_count'),
+    Input('mapping-table', 'page_current'),
+    Input('mapping-table', 'page_size'),
+    Input('grid-built', 'data'),
+    State('mapping-grid', 'data'),
+    prevent_initial_call=True
+)
+
+@instrumented
+def grid_page(page_current, page_size, built, grid_data):
+    grid = stored_frame(grid_data)
+    if grid.empty:
+        return [], 0
+    start = (page_current or 0) * page_size
+    page = grid.iloc[start:start + page_size].drop(columns='Activity')
+    page = page.astype(object).where(page.notna(), None)
+    page['id'] = page.index
+    return page.to_dict('records'), -(-len(grid) // page_size)
+
+# types edited in the grid: the edited grid is kept under a new key and only the activity of the edited rows goes back
+@callback(
+    Output('mapping-grid', 'data', allow_duplicate=True),
+    Output('mapping-table', 'data', allow_duplicate=True),
+    Output('btn-compute', 'disabled', allow_duplicate=True),
+    Output('mapping-status', 'children', allow_duplicate=True),
+    Input('mapping-table', 'data_timestamp'),
+    State('mapping-table', 'data'),
+    State('mapping-grid', 'data'),
+    prevent_initial_call=True
+)
+
+@instrumented
+def edit_type(timestamp, rows, grid_data):
+    grid = stored_frame(grid_data)
+    patch = Patch()
+    edited = False
+    for i, row in enumerate(rows or []):
+        if row['id'] in grid.index and row['Type'] != grid.at[row['id'], 'Type']:
+            grid = set_stream_type(grid, row['id'], row['Type'])
+            patch[i]['Activity name'] = grid.at[row['id'], 'Activity name']
+            edited = True
+    if not edited:
         raise PreventUpdate
-    elif type == 'Technosphere':
-        index = ctx.triggered_id['index']
-        children = [
-            dbc.Row(
-                [
-                    dbc.Col(
-                        [
-                            html.I("Technosphere flow:"),
-                            dbc.Input(
-                                id={'type': 'search-ecoinvent', 'index': index},
-                                type="text",
-                                placeholder="search technosphere",
-                            ),
-                        ], md=4,
-                    ),
-                    dbc.Col(
-                        [
-                            html.Br(),
-                            dcc.Dropdown(
-                                options=[],
-                                id={'type': 'ecoinvent-input', 'index': index},
-                                optionHeight=120,
-                            ),
-                            html.I(id= {'type': 'ecoinvent-input-name', 'index': index}),
-                        ], md=8,
-                    ),
-                ]
-            ),
-        ]
-        return children
-    
-    elif type == 'Biosphere':
-        index = ctx.triggered_id['index']
-        children = [
-            dbc.Row(
-                [
-                    dbc.Col(
-                        [
-                            html.I("Biosphere flow:"),
-                            dbc.Input(
-                                id={'type': 'search-bio', 'index': index},
-                                type="text",
-                                placeholder="search biosphere",
-                            ),
-                        ], md=4,
-                    ),
-                    dbc.Col(
-                        [
-                            html.Br(),
-                            dcc.Dropdown(
-                                options=[],
-                                id={'type': 'bio-input', 'index': index},
-                                optionHeight=120,
-                            ),
-                        ], md=8,
-                    ),
-                ]
-            ),
-        ]
-        return children
-    
-    else: 
-        return []
+    complete, message = mapping_status(grid)
+    return backend.session_store().put(grid), patch, not complete, message
 
-# search ecoinvent datasets and display the options 
-@callback(Output({'type': 'ecoinvent-input', 'index':MATCH}, 'options'),
-          Input({'type': 'search-ecoinvent', 'index':MATCH}, 'value'),
-          prevent_initial_call=True
+# activity editor of the selected stream
+@callback(
+    Output('grid-editor', 'style'),
+    Output('grid-stream', 'children'),
+    Output('grid-row', 'data'),
+    Output('grid-search', 'value'),
+    Output('grid-activity', 'options'),
+    Output('grid-activity', 'value'),
+    Output('grid-activity-name', 'children'),
+    Input('mapping-table', 'active_cell'),
+    State('mapping-grid', 'data'),
+    prevent_initial_call=True
 )
 
-def search_ecoinvent_activity(name):
-    if name is None:
+@instrumented
+def select_row(cell, grid_data):
+    if cell is None or cell.get('row_id') is None:
         raise PreventUpdate
-    else:
-        flow_list = ei_db.search(name, limit=50)
-        options = [{'label': f"{item['name']}, {item['location']}", 'value': item[1]} for item in flow_list]
-        return options
-    
-# search elementary flow and display the options 
-@callback(Output({'type': 'bio-input', 'index':MATCH}, 'options'),
-          Input({'type': 'search-bio', 'index':MATCH}, 'value'),
-          prevent_initial_call=True
+    grid = stored_frame(grid_data)
+    row = cell['row_id']
+    if row not in grid.index:
+        raise PreventUpdate
+    stream_type, code = grid.at[row, 'Type'], grid.at[row, 'Activity']
+    kind = activity_kind(stream_type)
+    if kind is None:
+        return {'display': 'none'}, None, None, None, [], None, None
+    node = backend.catalog().node(code) if code else None
+    title = f"{grid.at[row, 'Stream Name']} ({stream_type})"
+    if kind == 'biosphere':
+        return {'display': 'block'}, title, row, None, selected_options(node, detail='categories'), code, None
+    return {'display': 'block'}, title, row, None, selected_options(node), code, reference_product(node)
+
+# search the activity of the selected stream in the database of its type
+@callback(
+    Output('grid-activity', 'options', allow_duplicate=True),
+    Input('grid-search', 'value'),
+    State('grid-row', 'data'),
+    State('mapping-grid', 'data'),
+    prevent_initial_call=True
 )
 
-def search_biosphere(name):
-    if name is None:
+@instrumented
+def search_grid_activity(query, row, grid_data):
+    if query is None or row is None:
         raise PreventUpdate
-    else:
-        flow_list = bio_db.search(f'natural {name}', limit=50)
-        options = [{'label': f"{item['name']}, {item['categories']}", 'value': item[1]} for item in flow_list]
-        return options
+    stream_type = stored_frame(grid_data).at[row, 'Type']
+    if stream_type == 'Biosphere':
+        return search_options(backend.biosphere(), f'natural {query}', detail='categories')
+    if stream_type == 'Biosphere flow':
+        return search_options(backend.biosphere(), query, detail='categories')
+    return search_options(backend.ecoinvent(), query)
+
+# activity selected for the stream: the edited grid is kept under a new key and the row of the page is patched
+@callback(
+    Output('mapping-grid', 'data', allow_duplicate=True),
+    Output('mapping-table', 'data', allow_duplicate=True),
+    Output('grid-activity-name', 'children', allow_duplicate=True),
+    Output('btn-compute', 'disabled', allow_duplicate=True),
+    Output('mapping-status', 'children', allow_duplicate=True),
+    Input('grid-activity', 'value'),
+    State('grid-row', 'data'),
+    State('mapping-grid', 'data'),
+    State('mapping-table', 'data'),
+    prevent_initial_call=True
+)
 
-# display reference product of the selected activity
-@callback(Output({'type': 'ecoinvent-input-name', 'index': MATCH}, 'children'),
-          Input({'type': 'ecoinvent-input', 'index':MATCH}, 'value'),
-          prevent_initial_call=True
+@instrumented
+def set_grid_activity(code, row, grid_data, rows):
+    grid = stored_frame(grid_data)
+    if row is None or row not in grid.index or code == grid.at[row, 'Activity']:
+        raise PreventUpdate
+    node = backend.catalog().node(code) if code else None
+    grid.at[row, 'Activity'] = code
+    grid.at[row, 'Activity name'] = node_label(node)
+
+    patch = Patch()
+    for i, page_row in enumerate(rows or []):
+        if page_row['id'] == row:
+            patch[i]['Activity name'] = grid.at[row, 'Activity name']
+    complete, message = mapping_status(grid)
+    name = reference_product(node) if activity_kind(grid.at[row, 'Type']) == 'technosphere' else None
+    return backend.session_store().put(grid), patch, name, not complete, message
+
+# Dataframe setup for LCA calculation, built once per click from the complete mapping grid
+@callback(
+    Output('lca-setup', 'data'),
+    Output('graph', 'style'),
+    Output('stream-mapping', 'data'),
+    Input('btn-compute', 'n_clicks'),
+    State('mapping-grid', 'data'),
+    State('input-flows-store', 'data'),
+    State('output-flows-store', 'data'),
+    State('utilities-store', 'data'),
+    prevent_initial_call=True
 )
 
-def print_ei_name(ei_act):
-    if ei_act is None:
+@instrumented
+def lca_calc(n_clicks, grid_data, in_data, out_data, util_data):
+    grid = stored_frame(grid_data)
+    complete, _ = mapping_status(grid)
+    if not complete or in_data is None or out_data is None:
         raise PreventUpdate
-    else:
-        ref_product = bd.get_node(code = ei_act)['reference product']
-        return f"Reference product: {ref_product}"
 
-# load output element in the layout
-@callback(Output({'type':'output-element', 'index':MATCH}, 'children'),
-              Input({'type': 'output-type', 'index': MATCH}, 'value'),
-              prevent_initial_call=True) 
+    util_df = uploaded_frame(util_data, UTILITY_COLUMNS)
+    in_df, out_df, util_df = apply_mapping(stored_frame(in_data), stored_frame(out_data), util_df, grid[MAPPING_COLUMNS])
 
-def output_element(type):
-    if type is None:
-        raise PreventUpdate
-    elif type == 'Reference flow':
-        return []
-    elif type == 'Waste flow':
-        index = ctx.triggered_id['index']
-        children = [
-            dbc.Row(
-                [
-                    dbc.Col(
-                        [
-                            html.Br(),
-                            dbc.Input(
-                                id={'type': 'waste', 'index': index},
-                                type="text",
-                                placeholder="Search waste",
-                                # persistence=True,
-                                # persistence_type='session',
-                            ),
-                        ], md=4,
-                    ),
-                    dbc.Col(
-                        [
-                            html.Br(),
-                            dcc.Dropdown(
-                                options = [],
-                                id={'type': 'ecoinvent-waste', 'index': index},
-                                optionHeight=120,
-                                # persistence=True,
-                                # persistence_type='session',
-                            ),
-                            html.I(id= {'type': 'waste-name', 'index': index}),
-                        ], md=8,
-                    ),
-                ]
-            )
-        ]
-        return children
-    elif type == 'Biosphere flow':
-        index = ctx.triggered_id['index']
-        children = [
-            dbc.Row(
-                [
-                    dbc.Col(
-                        [
-                            html.Br(),
-                            dbc.Input(
-                                id={'type': 'bio', 'index': index},
-                                type="text",
-                                placeholder="Search emission",
-                                # persistence=True,
-                                # persistence_type='session',
-                            ),
-                        ], md=4,
-                    ),
-                    dbc.Col(
-                        [
-                            html.Br(),
-                            dcc.Dropdown(
-                                options = [],
-                                id={'type': 'emission', 'index': index},
-                                optionHeight=120,
-                                # persistence=True,
-                                # persistence_type='session',
-                            ),
-                        ], md=8,
-                    ),
-                ]
-            )
-        ]
-        return children
+    # metadata of all the selected activities and flows, resolved together
+    nodes = backend.catalog().resolve(grid['Activity'].dropna())
 
-# display an alert if no reference flow is selected
-@callback(Output('output-type-error', 'children'),
-              Input({'type': 'output-type', 'index': ALL}, 'value'),
-              prevent_initial_call=True) 
+    LCA_setting_df = lca_setup(in_df, out_df, util_df, nodes)
+    mapping = stream_mapping(in_df, out_df, util_df, nodes)
 
-def ref_alert(types):
-    if None in types:
-        raise PreventUpdate
-    elif 'Reference flow' not in types:
-        children = [dbc.Alert("One of the output must be the reference flow", color="danger"),]
-        return children
+    style = {'display':'block'}
+
+    return backend.session_store().put(LCA_setting_df), style, backend.session_store().put(mapping)
 
-# search waste activity
-@callback(Output({'type': 'ecoinvent-waste', 'index':MATCH}, 'options'),
-          Input({'type': 'waste', 'index':MATCH}, 'value'),
-          prevent_initial_call=True
+# Dataframe setup for LCA calculation from the mapping template, in one go when the streams are uploaded
+@callback(
+    Output('lca-setup', 'data', allow_duplicate=True),
+    Output('graph', 'style', allow_duplicate=True),
+    Output('stream-mapping', 'data', allow_duplicate=True),
+    Input('input-flows-store', 'data'),
+    Input('output-flows-store', 'data'),
+    Input('utilities-store', 'data'),
+    State('mapping-template', 'value'),
+    prevent_initial_call=True
 )
 
-def search_waste_activity(waste):
-    if waste is None:
+@instrumented
+def apply_template(in_data, out_data, util_data, template):
+    mapping = backend.template_store().load(template) if template else None
+    if mapping is None or in_data is None or out_data is None:
         raise PreventUpdate
-    else:
-        ei_waste_list = ei_db.search(waste, limit=50)
-        options = [{'label': f"{item['name']}, {item['location']}", 'value': item[1]} for item in ei_waste_list]
-        return options
-    
-# display waste ref. product
-@callback(Output({'type': 'waste-name', 'index': MATCH}, 'children'),
-          Input({'type': 'ecoinvent-waste', 'index':MATCH}, 'value'),
-          prevent_initial_call=True
+    in_df, out_df = stored_frame(in_data), stored_frame(out_data)
+    util_df = uploaded_frame(util_data, UTILITY_COLUMNS)
+    streams = pd.concat([in_df, out_df, util_df])['Stream Name']
+    try:
+        nodes = backend.catalog().resolve(mapping.loc[mapping['Stream Name'].isin(streams), 'Activity'].dropna())
+    except KeyError:
+        raise PreventUpdate
+    # computed only when the template maps every stream, as the grid shows it (the other uploads are mapped in the grid)
+    grid = mapping_grid(in_df, out_df, util_df, mapping, nodes)
+    complete, _ = mapping_status(grid)
+    if not complete:
+        raise PreventUpdate
+    in_df, out_df, util_df = apply_mapping(in_df, out_df, util_df, grid[MAPPING_COLUMNS])
+    LCA_setting_df = lca_setup(in_df, out_df, util_df, nodes)
+    mapping = stream_mapping(in_df, out_df, util_df, nodes)
+    return backend.session_store().put(LCA_setting_df), {'display':'block'}, backend.session_store().put(mapping)
+
+# new exports of the watched folder: the streams replace the uploaded ones, which rebuilds the grid with the mapping
+# of the streams already mapped, and the results are computed again with the stored mapping (the selected template,
+# or the mapping of the last computation) when it maps every stream. Only the streams whose activity is new to the
+# server are solved, the others take their cached impacts per unit
+@callback(
+    Output('watch-status', 'children'),
+    Output('watch-version', 'data'),
+    Output('input-flows-store', 'data', allow_duplicate=True),
+    Output('output-flows-store', 'data', allow_duplicate=True),
+    Output('utilities-store', 'data', allow_duplicate=True),
+    Output('toggle-category', 'style', allow_duplicate=True),
+    Output('lca-setup', 'data', allow_duplicate=True),
+    Output('graph', 'style', allow_duplicate=True),
+    Input('watch-interval', 'n_intervals'),
+    State('watch-version', 'data'),
+    State('input-flows-store', 'data'),
+    State('output-flows-store', 'data'),
+    State('utilities-store', 'data'),
+    State('stream-mapping', 'data'),
+    State('mapping-template', 'value'),
+    prevent_initial_call=True
 )
 
-def print_waste_name(waste_act):
-    if waste_act is None:
+@instrumented
+def watch_exports(n_intervals, version, in_data, out_data, util_data, mapping_data, template):
+    watched = backend.watch_folder()
+    export = watched.latest() if watched is not None else None
+    if export is None or export.version == version:
         raise PreventUpdate
-    else:
-        print(waste_act)
-        ref_product = bd.get_node(code = waste_act)['reference product']
-        return f"Reference product: {ref_product}"
+    files = ', '.join(export.files.values())
+    stamp = datetime.datetime.now().strftime('%H:%M:%S')
+    if export.error is not None:
+        return f'{stamp} {files}: there was an error processing the export: {export.error}', export.version, \
+            no_update, no_update, no_update, no_update, no_update, no_update
+
+    # streams shown in the dashboard (expired ones count as none)
+    store = backend.session_store()
+    previous = [store.get(key) if key is not None else None for key in (in_data, out_data, util_data)]
+    current = stream_table(export.in_df, export.out_df, export.util_df)
+    added, removed, changed = diff_streams(stream_table(*previous), current)
+    if previous[0] is not None and not (added or removed or changed):
+        return f'{stamp} {files}: no stream changed', export.version, \
+            no_update, no_update, no_update, no_update, no_update, no_update
+
+    in_key, out_key, util_key = store.put(export.in_df), store.put(export.out_df), store.put(export.util_df)
+    message = f'{stamp} {files}: {diff_message(added, removed, changed)}'
+    # with a template, apply_template computes the results once the streams are stored
+    if template:
+        return message, export.version, in_key, out_key, util_key, {'display': 'block'}, no_update, no_update
+    mapping = store.get(mapping_data) if mapping_data is not None else None
+    if mapping is None:
+        return f'{message}, map the streams and compute', export.version, in_key, out_key, util_key, \
+            {'display': 'block'}, no_update, no_update
+
+    streams = pd.concat([export.in_df, export.out_df, export.util_df])['Stream Name']
+    unmapped = int((~streams.isin(mapping['Stream Name'])).sum())
+    in_df, out_df, util_df = apply_mapping(export.in_df, export.out_df, export.util_df, mapping)
+    try:
+        if unmapped:
+            raise ValueError(f'{unmapped} stream(s) to map')
+        nodes = backend.catalog().resolve(pd.concat([in_df, out_df, util_df])['Activity'].dropna())
+        LCA_setting_df = lca_setup(in_df, out_df, util_df, nodes)
+    except (KeyError, ValueError) as e:
+        return f'{message}, not computed: {e}', export.version, in_key, out_key, util_key, {'display': 'block'}, \
+            no_update, no_update
+    return f'{message}, results computed again', export.version, in_key, out_key, util_key, {'display': 'block'}, \
+        store.put(LCA_setting_df), {'display': 'block'}
+
+# saved templates, listed when the page is loaded and after each save
+@callback(
+    Output('mapping-template', 'options'),
+    Input('template-saved', 'children'),
+)
+
+@instrumented
+def template_options(saved):
+    return backend.template_store().names()
 
-# search emission
-@callback(Output({'type': 'emission', 'index':MATCH}, 'options'),
-          Input({'type': 'bio', 'index':MATCH}, 'value'),
-          prevent_initial_call=True
+# save the current mapping of the streams as a template
+@callback(
+    Output('template-saved', 'children'),
+    Input('btn-save-template', 'n_clicks'),
+    State('template-name', 'value'),
+    State('stream-mapping', 'data'),
+    prevent_initial_call=True
 )
 
-def search_emission(bio):
-    if bio is None:
+@instrumented
+def save_template(n_clicks, name, mapping_data):
+    mapping = stored_frame(mapping_data)
+    if not name or mapping.empty:
+        return " Map the streams and give a name to the template"
+    backend.template_store().save(name.strip(), mapping)
+    return f" Template '{name.strip()}' saved"
+
+# stages of an LCA job, shown in the progress bar
+LCA_STAGES = ['matrices loaded', 'streams solved', 'categories characterized']
+
+# graph and total of the selected category
+def results_view(lca_df, total, category):
+    tot_impact = total[[met[1] for met in backend.methods()].index(category)]
+    unit = lca_df.loc[lca_df['Impact category']==category, 'Impact unit'].iloc[0]
+    px = plotly_express()
+    fig = px.bar(lca_df.loc[lca_df['Impact category']==category], x = "Impact category", 
+                 y = 'Impact', color = "Stream Name", template="minty", barmode='stack', width=400, height=600)
+    fig.update_yaxes(title={'text':''},tickfont={'size':18}, tickformat='.1e')
+
+    fig.update_xaxes(matches=None, showticklabels=False, title="")
+
+
+    fig.update_traces(
+        marker=dict(line_color="black")#, pattern_fillmode="replace")
+    )
+
+    children = [
+        html.H3("Total impact:"),
+        html.Br(),
+        html.H4(f"{tot_impact:.1e} {unit}")
+    ]
+    return fig, children
+
+# results of the selected category: served right away when they are in the cache (e.g. when switching category),
+# otherwise handed to the background job (lca-pending)
+@callback(
+    Output('graph', 'figure'),
+    Output('tot-impact', 'children'),
+    Output('toggle-contributions', 'style'),
+    Output('export-links', 'style'),
+    Output('lca-pending', 'data'),
+    Input('impact-category', 'value'),
+    Input('lca-setup', 'data'),
+    prevent_initial_call = True
+)
+
+@instrumented
+def show_results(category, lca_data):
+    if category is None or lca_data is None:
         raise PreventUpdate
-    else:
-        emission_list = bio_db.search(bio, limit=50)
-        options = [{'label': f"{item['name']}, {item['categories']}", 'value': item[1]} for item in emission_list]
-        return options
+    results = stream_results(stored_frame(lca_data), compute=False)
+    if results is None:
+        return no_update, no_update, no_update, no_update, {'setup': lca_data, 'category': category}
+    fig, children = results_view(*results, category)
+    return fig, children, {'display': 'block'}, {'display': 'block'}, no_update
 
-# Utility element
-@callback(Output('utility-data-upload', 'children'),
-          Output('utilities-store', 'data'),
-          Output('toggle-category', 'style', allow_duplicate=True),
-              Input('upload-utility', 'contents'),
-              State('upload-utility', 'filename'),
-              State('upload-utility', 'last_modified'),
-              prevent_initial_call=True,
-              ) 
+# LCA calculation of the results that are not in the cache, as a background job that does not hold a server thread
+@callback(
+    Output('graph', 'figure', allow_duplicate=True),
+    Output('tot-impact', 'children', allow_duplicate=True),
+    Output('toggle-contributions', 'style', allow_duplicate=True),
+    Output('export-links', 'style', allow_duplicate=True),
+    Input('lca-pending', 'data'),
+    background=True,
+    progress=[Output('lca-progress', 'value'), Output('lca-progress', 'label')],
+    progress_default=[0, ''],
+    running=[
+        (Output('lca-progress', 'style'), {'display': 'flex'}, {'display': 'none'}),
+        (Output('cancel-lca', 'style'), {'display': 'block'}, {'display': 'none'}),
+    ],
+    cancel=[Input('cancel-lca', 'n_clicks')],
+    prevent_initial_call = True
+)
 
-def utility_upload(content, filename, date):
-    content_type, content_string = content.split(',')
+@instrumented
+def update_graph(set_progress, pending):
+    if pending is None:
+        raise PreventUpdate
 
+    def progress(stage, done, total):
+        value = 100 * (LCA_STAGES.index(stage) + done / total) / len(LCA_STAGES)
+        set_progress((value, f'{stage} ({done}/{total})'))
 
-    try:
-        decoded = base64.b64decode(content_string)
-        if 'xlsx' in filename:
-            # Assume that the user uploaded an excel file
-            utility_import_df = pd.read_excel(io.BytesIO(decoded)).rename(columns={'Utility ID':'Stream Name', 'Unnamed: 1':'Units'})
-            
-            # Create new DataFrames based on 'From' and 'To' conditions if material_df is not empty
-            if not utility_import_df.empty:
-                utility_df = utility_import_df.loc[(utility_import_df['Stream Name']=='Utility type')|(utility_import_df['Stream Name']=='Ultimate fuel source')|(utility_import_df['Stream Name']=='Mass flow')|(utility_import_df['Stream Name']=='Duty')].reset_index(drop=True)
-                utility_flows = [
-                    html.Div(
-                        children=[
-                            html.Br(),
-                            dbc.Row(
-                                [
-                                    dbc.Col(
-                                        [
-                                            html.H4(f'{utility_df.columns[i]}', id={'type':'utility-name', 'index': i}),
-                                            html.H5(f"type: {utility_df[utility_df['Stream Name']=='Utility type'].iloc[0,i]}"),
-                                            html.H5(f"source: {utility_df[utility_df['Stream Name'] == 'Ultimate fuel source'].iloc[0,i]}"),
-                                            html.Br(),
-                                        ],md=3,
-                                    ),
-                                    dbc.Col(
-                                        [
-                                            html.I('Ecoinvent activity:'),
-                                            dbc.Input(
-                                                id={'type': 'search-utility', 'index': i},
-                                                type="text",
-                                                placeholder="Search ecoinvent activity",
-                                                
-                                                # persistence=True,
-                                                # persistence_type='session',
-                                            ),
-                                        ], md=3,
-                                    ),
-                                    dbc.Col(
-                                        [
-                                            html.Br(),
-                                            dcc.Dropdown(
-                                                options = [],
-                                                id={'type': 'ecoinvent-utility', 'index': i},
-                                                optionHeight=120,
-                                                # persistence=True,
-                                                # persistence_type='session',
-                                            ),
-                                            html.I(id= {'type': 'utility-ecoinvent-name', 'index': i}),
-                                        ], md=6,
-                                    ),
-                                ],
-                                className="align-items-md-stretch",
-                            ),
-                        ]
-                    ) for i in range(2, len(utility_df.columns))
-                ]
+    lca_df, total = stream_results(stored_frame(pending['setup']), progress)
+    fig, children = results_view(lca_df, total, pending['category'])
+    return fig, children, {'display': 'block'}, {'display': 'block'}
 
-                children = [html.H5(f'Uploaded file: {filename}'),html.Br(),] + utility_flows
-                style = {'display': 'block'}
 
-                util_unit_df=utility_df.iloc[1:, :2]
-                util_df = utility_df.iloc[1:, :].drop(columns=['Units']).set_index('Stream Name').T
-                util_df.rename(columns={'Mass flow':'Mass Flows'}, inplace=True)
-                mass_unit = util_unit_df[util_unit_df['Stream Name'] == 'Mass flow']['Units'].values[0]
-                energy_unit = util_unit_df[util_unit_df['Stream Name'] == 'Duty']['Units'].values[0]
-                util_df['Type'] = 'Utility'
-                util_df_reset = util_df.reset_index()
-                util_df_reset['Mass flow'] = util_df_reset['Mass Flows'] * conversion_factors[mass_unit]
-                util_df_reset['Duty'] = util_df_reset['Duty'] * conversion_factors[energy_unit]
+# contributions of a new setup: shown right away when they are in the cache, analysed on demand otherwise
+@callback(
+    Output('lca-contributions', 'data'),
+    Input('lca-setup', 'data'),
+    prevent_initial_call=True
+)
 
-                
+@instrumented
+def cached_contributions(lca_data):
+    setup_df = stored_frame(lca_data)
+    contribution_df = contribution_results(setup_df, compute=False) if not setup_df.empty else None
+    return backend.session_store().put(contribution_df) if contribution_df is not None else None
 
-                return children, util_df_reset.to_dict("records"), style
-            
-            else:
-                children = [
-                    html.Div([
-                        html.H5(f'Uploaded file: {filename}'),
-                        html.Div("The utility sheet is empty, select another file")
+# contribution analysis of the setup, as a background job
+@callback(
+    Output('lca-contributions', 'data', allow_duplicate=True),
+    Input('btn-contributions', 'n_clicks'),
+    State('lca-setup', 'data'),
+    background=True,
+    running=[(Output('btn-contributions', 'disabled'), True, False)],
+    prevent_initial_call=True
+)
 
-                    ])
-                ]
-                style = {'display': 'None'}
-                utlity_data = None
-                
-                return children, utlity_data, style
+@instrumented
+def analyse_contributions(n_clicks, lca_data):
+    setup_df = stored_frame(lca_data)
+    if setup_df.empty:
+        raise PreventUpdate
+    return backend.session_store().put(contribution_results(setup_df))
 
-    except Exception as e:
-        print(e)
-        return html.Div([
-            'There was an error processing this file. Upload only .xlsx file'
-        ]), None, {'display': 'None'}
-    
-# search utility in ecoinvent
-@callback(Output({'type': 'ecoinvent-utility', 'index':MATCH}, 'options'),
-          Input({'type': 'search-utility', 'index':MATCH}, 'value'),
-          prevent_initial_call=True
+# top contributions of the selected category
+@callback(
+    Output('contribution-graph', 'figure'),
+    Output('contribution-graph', 'style'),
+    Input('contribution-kind', 'value'),
+    Input('lca-contributions', 'data'),
+    Input('impact-category', 'value'),
+    prevent_initial_call=True
 )
 
-def search_ecoinvent_utility(name):
-    if name is None:
+@instrumented
+def contribution_graph(kind, contribution_data, category):
+    contribution_df = stored_frame(contribution_data)
+    if contribution_df.empty or category is None:
+        return no_update, {'display': 'none'}
+    top_df = contribution_df[(contribution_df['Impact category'] == category) & (contribution_df['Contribution'] == kind)].head(10)
+    labels = top_df['Name'].astype(str).str.slice(0, 60) + ' (' + top_df['Location'].astype(str) + ')'
+    px = plotly_express()
+    fig = px.bar(top_df.assign(Label=labels), x='Impact', y='Label', orientation='h', hover_data=['Share'],
+                 template="minty", height=450)
+    fig.update_yaxes(title={'text': ''}, autorange='reversed')
+    fig.update_xaxes(tickformat='.1e')
+    return fig, {'display': 'block'}
+
+
+# links to the exports of the results of the setup; the files are written by the server when they are requested
+@callback(
+    Output('export-streams-csv', 'href'),
+    Output('export-streams-parquet', 'href'),
+    Output('export-contributions-csv', 'href'),
+    Output('export-excel-link', 'children'),
+    Input('lca-setup', 'data'),
+    prevent_initial_call=True
+)
+
+@instrumented
+def export_links(lca_data):
+    if lca_data is None:
         raise PreventUpdate
-    else:
-        ei_activity_list = ei_db.search(name, limit=50)
-        options = [{'label': f"{item['name']}, {item['location']}", 'value': item[1]} for item in ei_activity_list]
-        return options
-    
-# display utility ref. product
-@callback(Output({'type': 'utility-ecoinvent-name', 'index': MATCH}, 'children'),
-          Input({'type': 'ecoinvent-utility', 'index':MATCH}, 'value'),
-          prevent_initial_call=True
+    return (f'/export/{lca_data}.csv', f'/export/{lca_data}.parquet',
+            f'/export/{lca_data}.csv?table=contributions', None)
+
+# Excel workbook of the results, written as a background job (one sheet per category, then the contributions)
+@callback(
+    Output('export-excel-link', 'children', allow_duplicate=True),
+    Input('btn-export-excel', 'n_clicks'),
+    State('lca-setup', 'data'),
+    background=True,
+    running=[(Output('btn-export-excel', 'disabled'), True, False)],
+    prevent_initial_call=True
 )
 
-def print_util_ei_name(util_act):
-    if util_act is None:
+@instrumented
+def export_excel(n_clicks, lca_data):
+    setup_df = stored_frame(lca_data)
+    if setup_df.empty:
         raise PreventUpdate
-    else:
-        ref_product = bd.get_node(code = util_act)['reference product']
-        return f"Reference product: {ref_product}"
+    export_file(lca_results(setup_df), results_key(setup_df), 'xlsx', export_dir())
+    return html.A("Excel workbook", href=f'/export/{lca_data}.xlsx')
+
+# the sweep is available once the streams are mapped
+clientside_callback(
+    ClientsideFunction(namespace='layout', function_name='showWithSetup'),
+    Output('toggle-sweep', 'style'),
+    Input('lca-setup', 'data'),
+    prevent_initial_call=True
+)
 
-# Dataframe setup for LCA calculation
+# sweep over the cases of the uploaded table, all solved together as a background job. The totals are kept on the
+# server and plotted for the selected category (see sweep_graph)
 @callback(
-    Output('lca-setup', 'data'),
-    Output('graph', 'style'),
-    Input({'type': 'ecoinvent-input', 'index':ALL}, 'value'),
-    Input({'type': 'bio-input', 'index':ALL}, 'value'),
-    Input({'type':"flow-type-input",'index': ALL}, 'value'),
-    Input({'type': 'output-type', 'index': ALL}, 'value'),
-    Input({'type': 'ecoinvent-waste', 'index':ALL}, 'value'),
-    Input({'type': 'emission', 'index':ALL}, 'value'),
-    Input({'type': 'ecoinvent-utility', 'index':ALL}, 'value'),
+    Output('sweep-message', 'children'),
+    Output('sweep-results', 'data'),
+    Output('btn-download-sweep', 'style'),
+    Input('upload-sweep', 'contents'),
+    State('upload-sweep', 'filename'),
     State('input-flows-store', 'data'),
     State('output-flows-store', 'data'),
     State('utilities-store', 'data'),
+    State('stream-mapping', 'data'),
+    background=True,
     prevent_initial_call=True
 )
 
-def lca_calc(act_in, bio_in, in_type, out_type, act_waste, emission, act_util, in_data, out_data, util_data):
-    if 'Reference flow' not in out_type:
+@instrumented
+def sweep(content, filename, in_data, out_data, util_data, mapping_data):
+    if content is None:
         raise PreventUpdate
-    
-    else:
-        in_df = pd.DataFrame(in_data)
-        in_df.rename(columns={'index':'Stream Name'}, inplace = True)
-        
-        in_df['Type']= None
-        if len(in_type) != len(in_df['Type']):
-            raise PreventUpdate
-        else:
-            in_df['Type']= in_type
-            in_df['Activity'] = None
-            in_df.loc[in_df['Type']=='Technosphere','Activity'] = act_in
-            in_df.loc[in_df['Type']=='Biosphere','Activity'] = bio_in
-            in_df['Act unit'] = None
-            for i in range(len(in_df)):
-                if in_df.loc[i, 'Type'] == 'No impact':
-                    in_df.loc[i,'Act unit'] = None
-                else:
-                    in_df.loc[i,'Act unit'] = bd.get_node(code=in_df.loc[i, 'Activity'])['unit']
-            out_df = pd.DataFrame(out_data)
-            out_df.rename(columns={'index':'Stream Name'}, inplace = True)
-            out_df['Type']=None
-            out_df['Type']=out_type
-            out_df['Activity'] = None
-            out_df.loc[out_df['Type']=='Waste flow', 'Activity'] = act_waste
-            out_df.loc[out_df['Type']=='Biosphere flow', 'Activity'] = emission
-            out_df['Act unit'] = None
-            for i in range(len(out_df)):
-                if out_df.loc[i, 'Type']== "Waste flow":
-                    if out_df.loc[i, 'Activity'] is None:
-                        out_df.loc[i,'Act unit'] = None
-                    else:
-                        out_df.loc[i,'Act unit'] = bd.get_node(code=out_df.loc[i, 'Activity'])['unit']
-                        if bd.get_node(code=out_df.loc[i, 'Activity'])['production amount']<0:
-                            out_df.loc[i, 'Mass Flows'] *=(-1)
-                            out_df.loc[i, 'Volume Flow'] *=(-1)
-                else:
-                    out_df.loc[i,'Act unit'] = "kilogram"
-
-            util_df = pd.DataFrame(util_data)
-            util_df.rename(columns={'index':'Stream Name'}, inplace = True)
-            util_df['Activity'] = None
-            util_df['Activity'] = act_util
-            util_df['Act unit'] = None
-            for i in range(len(util_df)):
-                if util_df.loc[i, 'Activity'] is None:
-                    util_df.loc[i,'Act unit'] = None
-                else:
-                    util_df.loc[i,'Act unit'] = bd.get_node(code=util_df.loc[i, 'Activity'])['unit']
-            
-
-            reference_mass_flow=out_df.loc[out_df['Type'] == "Reference flow",'Mass Flows']
-
-            out_df['Amount'] = out_df.apply(calculate_amount, axis=1, ref_mass_flow=reference_mass_flow)
-            in_df['Amount'] = in_df.apply(calculate_amount, axis=1, ref_mass_flow=reference_mass_flow)
-            util_df['Amount'] = util_df.apply(calculate_amount, axis=1, ref_mass_flow=reference_mass_flow)
-
-            act_df = pd.concat([in_df, out_df])
-            act_df.loc[act_df['Type']=='Reference flow', 'Activity']=act_df.loc[act_df['Type']=='Reference flow', 'Stream Name']
-            # ref_act = create_ref_act(act_df)
-
-            act_dff = act_df[~act_df['Type'].str.contains('Biosphere', na=False)]
-            
-            LCA_setting_df = pd.concat([act_dff, util_df])[['Stream Name', 'Type', 'Activity','Act unit','Amount']]
-
-            style = {'display':'block'}
+    mapping = stored_frame(mapping_data)
+    if mapping.empty:
+        return html.Div(['Map the streams before running a sweep']), None, {'display': 'none'}
+    try:
+        cases = read_sweep_table(base64.b64decode(content.split(',')[1]), filename)
+        util_df = stored_frame(util_data) if util_data is not None else pd.DataFrame(columns=UTILITY_COLUMNS)
+        in_df, out_df, util_df = apply_mapping(stored_frame(in_data), stored_frame(out_data), util_df, mapping)
+        nodes = backend.catalog().resolve(mapping['Activity'].dropna())
+        sweep_df = sweep_results(sweep_setups(in_df, out_df, util_df, nodes, cases), list(cases.index))
+    except Exception as e:
+        return html.Div([f'There was an error processing this table: {e}']), None, {'display': 'none'}
 
-            return LCA_setting_df.to_dict("records"), style
+    unknown = [name for name in cases.columns if name not in set(mapping['Stream Name'])]
+    message = [html.I(f"{len(cases)} cases. Streams not in the uploads: {', '.join(unknown)}" if unknown else f"{len(cases)} cases")]
+    return message, backend.session_store().put(sweep_df.reset_index()), {'display': 'block'}
 
-# LCA calculation and visualization of results
+# totals of the sweep for the selected category, plotted again from the stored results when the category changes
 @callback(
-    Output('graph', 'figure'),
-    Output('tot-impact', 'children'),
-    Output('lca-results', 'data'),
-    Output("btn-download", "style"),
+    Output('sweep-graph', 'figure'),
+    Output('sweep-graph', 'style'),
+    Input('sweep-results', 'data'),
     Input('impact-category', 'value'),
-    State('lca-setup', 'data'),
-    prevent_initial_call = True
+    prevent_initial_call=True
 )
 
-def update_graph(category, lca_data):
-    if category is None:
-        raise PreventUpdate
-    else:
-        lca_setting_df = pd.DataFrame(lca_data)
-        lca_setting_clean_df=lca_setting_df.dropna(subset=['Activity']).reset_index(drop=True)
-        LCIA_df_list=[]
-        lca_df=lca_setting_clean_df.copy()
-
-        for i in range(len(EF_select)):
-            lca_df=lca_setting_clean_df.copy()
-            lca_df['Impact category']=EF_select[i][1]
-            lca_df['Impact unit']=str(bd.methods[EF_select[i]]["unit"])
-            LCIA_df_list.append(lca_df)
-
-        lca_df=pd.concat(LCIA_df_list)
-        lca_df['Impact'] = 0.0
-        lca_df.reset_index(inplace=True, drop=True)
-
-        activity = bd.get_node(code = lca_setting_clean_df['Activity'][0])
-        lca = bc.LCA({activity:lca_setting_clean_df['Amount'][0]}, EF_select[0])
-        lca.lci()
-
-        for j in range(len(lca_setting_clean_df)):
-                activity =bd.get_node(code = lca_setting_clean_df['Activity'][j])
-
-                lca.redo_lci({activity.id:lca_setting_clean_df['Amount'][j]})
-                for i in range(len(EF_select)):
-                        lca.switch_method(EF_select[i])
-                        lca.lcia()
-                        lca_df.loc[(lca_df['Impact category']==EF_select[i][1]) 
-                                        &  (lca_df['Activity']==lca_setting_clean_df['Activity'][j]) ,'Impact']=lca.score
-
-        tot_impact = lca_df.loc[lca_df['Impact category']==category, 'Impact'].sum()
-        unit = lca_df.loc[lca_df['Impact category']==category, 'Impact unit'].iloc[0]
-        fig = px.bar(lca_df.loc[lca_df['Impact category']==category], x = "Impact category", 
-                     y = 'Impact', color = "Stream Name", template="minty", barmode='stack', width=400, height=600)
-        fig.update_yaxes(title={'text':''},tickfont={'size':18}, tickformat='.1e')
-
-        fig.update_xaxes(matches=None, showticklabels=False, title="")
-
-
-        fig.update_traces(
-            marker=dict(line_color="black")#, pattern_fillmode="replace")
-        )
-
-        children = [
-            html.H3("Total impact:"),
-            html.Br(),
-            html.H4(f"{tot_impact:.1e} {unit}")
-        ]
-
-        return fig, children, lca_df.to_dict('records'), {'display': 'block'}
+@instrumented
+def sweep_graph(sweep_data, category):
+    sweep_df = stored_frame(sweep_data)
+    if sweep_df.empty:
+        return no_update, {'display': 'none'}
+    if category not in sweep_df.columns:
+        category = sweep_df.columns[1]
+    px = plotly_express()
+    fig = px.line(sweep_df, x='Case', y=category, markers=True, template="minty", height=400)
+    fig.update_yaxes(tickformat='.1e')
+    return fig, {'display': 'block'}
 
 
 @callback(
-    Output("download-lcia", "data"),
-    Input("btn-download", "n_clicks"),
-    State('lca-results', 'data'),
+    Output("download-sweep", "data"),
+    Input("btn-download-sweep", "n_clicks"),
+    State('sweep-results', 'data'),
     prevent_initial_call=True,
 )
 
-def func(n_clicks, lca_data):
-    lcia_df = pd.DataFrame(lca_data)
-    if not lcia_df.empty:
-        return dcc.send_data_frame(lcia_df.to_excel, "lca_results.xlsx", index = False)
+@instrumented
+def download_sweep(n_clicks, sweep_data):
+    sweep_df = stored_frame(sweep_data)
+    if not sweep_df.empty:
+        return dcc.send_data_frame(sweep_df.to_excel, "sweep_results.xlsx", index = False)
+
+# Monte Carlo is available once the streams are mapped
+clientside_callback(
+    ClientsideFunction(namespace='layout', function_name='showWithSetup'),
+    Output('toggle-montecarlo', 'style'),
+    Input('lca-setup', 'data'),
+    prevent_initial_call=True
+)
+
+# histogram and percentiles of the selected category, from the summary of the iterations done so far
+def montecarlo_view(summary, category):
+    i = [met[1] for met in summary.methods].index(category)
+    histogram = summary.histograms[i]
+    edges = histogram.edges
+    px = plotly_express()
+    fig = px.bar(x=(edges[:-1] + edges[1:]) / 2, y=histogram.counts, template="minty", height=400)
+    fig.update_traces(width=histogram.width)
+    fig.update_xaxes(title={'text': category}, tickformat='.2e')
+    fig.update_yaxes(title={'text': 'Iterations'})
+
+    unit = method_unit(summary.methods[i])
+    percentiles = summary.percentiles()[i]
+    children = [
+        html.H5(f"{summary.count} iterations: mean {summary.mean[i]:.2e}, standard deviation {summary.std[i]:.2e} {unit}"),
+        html.I(', '.join(f'P{q:g}: {value:.2e}' for q, value in zip(PERCENTILES, percentiles))),
+    ]
+    return fig, children
+
+# Monte Carlo of the mapped process as a background job: the iterations run over a process pool
+# and the histogram is updated as they complete
+@callback(
+    Output('mc-graph', 'figure'),
+    Output('mc-graph', 'style'),
+    Output('mc-summary', 'children'),
+    Input('btn-montecarlo', 'n_clicks'),
+    State('impact-category', 'value'),
+    State('mc-iterations', 'value'),
+    State('mc-uncertainty', 'value'),
+    State('mc-seed', 'value'),
+    State('lca-setup', 'data'),
+    background=True,
+    progress=[Output('mc-graph', 'figure'), Output('mc-graph', 'style'), Output('mc-summary', 'children'),
+              Output('mc-progress', 'value')],
+    running=[
+        (Output('btn-montecarlo', 'disabled'), True, False),
+        (Output('mc-progress', 'style'), {'display': 'flex'}, {'display': 'none'}),
+        (Output('cancel-montecarlo', 'style'), {'display': 'inline-block'}, {'display': 'none'}),
+    ],
+    cancel=[Input('cancel-montecarlo', 'n_clicks')],
+    prevent_initial_call=True
+)
+
+@instrumented
+def montecarlo(set_progress, n_clicks, category, iterations, uncertainty, seed, lca_data):
+    setup_df = stored_frame(lca_data)
+    if setup_df.empty:
+        raise PreventUpdate
+    methods = backend.methods()
+    category = category or methods[0][1]
+    iterations = int(iterations or 1000)
+    relative_std = (uncertainty or 0) / 100
+
+    summary = None
+    for summary in monte_carlo(setup_df, methods, iterations=iterations, relative_std=relative_std, seed=seed,
+                               initializer=backend.apply_settings, initargs=(backend.settings(),)):
+        fig, children = montecarlo_view(summary, category)
+        set_progress((fig, {'display': 'block'}, children, 100 * summary.count / iterations))
+    fig, children = montecarlo_view(summary, category)
+    return fig, {'display': 'block'}, children
+
+# folder of the export files, shared by the server and the background jobs
+def export_dir():
+    return os.path.join(backend.work_dir(), 'exports')
+
+# export of the results of a setup (key of the lca-setup store): ?table=contributions for the top contributions.
+# CSV is streamed in chunks, Parquet and Excel are written once per result and sent as files.
+# Only results in the cache are exported: they are computed by the background jobs, never in the request (409)
+@server.route('/export/<key>.<fmt>')
+def export_results(key, fmt):
+    table = request.args.get('table', 'streams')
+    if fmt not in EXPORT_FORMATS or table not in EXPORT_TABLES:
+        abort(404)
+    setup_df = backend.session_store().get(key)
+    if setup_df is None:
+        abort(404)
+    streams = stream_results(setup_df, compute=False) if fmt == 'xlsx' or table == 'streams' else (None, None)
+    if streams is None:
+        abort(409, description='The results are not computed yet: compute them in the dashboard first.')
+    contribution_df = None
+    if fmt == 'xlsx' or table == 'contributions':
+        contribution_df = contribution_results(setup_df, compute=False)
+        if contribution_df is None:
+            abort(409, description='The contributions are not analysed yet: analyse them in the dashboard first.')
+    results = (*streams, contribution_df)
+    name = 'lca_results' if fmt == 'xlsx' else f'lca_{table}'
+    if fmt == 'csv':
+        return Response(stream_with_context(csv_chunks(result_table(results, table))),
+                        mimetype=EXPORT_FORMATS[fmt], headers={'Content-Disposition': f'attachment; filename={name}.csv'})
+    path = export_file(results, results_key(setup_df), fmt, export_dir(), table)
+    return send_file(path, mimetype=EXPORT_FORMATS[fmt], as_attachment=True, download_name=f'{name}.{fmt}')
+
+# metrics of the server in the Prometheus text format
+@server.route('/metrics')
+def prometheus_metrics():
+    return metrics.prometheus_text(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+# profile of the startup stages, completed by the warm-up
+@server.route('/startup-profile')
+def startup_profile():
+    return startup_report(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+record('app ready', time.perf_counter() - START)
+if config.WARM_UP:
+    backend.start_warm_up()
 
 if __name__ == "__main__":
-    app.run(debug=False, dev_tools_hot_reload=False, )
+    logging.basicConfig(level=logging.INFO)
+    app.run(host=config.HOST, port=config.PORT, debug=False, dev_tools_hot_reload=False, )
 
 
 
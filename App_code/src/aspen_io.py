@@ -0,0 +1,121 @@
+# selective reader of the stream tables exported from Aspen Plus (xlsx, csv or parquet)
+import csv
+import io
+from collections import namedtuple
+
+import pandas as pd
+
+# rows of the material stream table used by the app (the first occurrence is the total stream)
+MATERIAL_HEADER = 'Stream Name'
+MATERIAL_TEXT_ROWS = ('From', 'To')
+MATERIAL_NUMERIC_ROWS = ('Mass Flows', 'Volume Flow')
+# read when present, for activities measured in moles
+MATERIAL_OPTIONAL_ROWS = ('Mole Flows',)
+
+# rows of the utility table used by the app
+UTILITY_HEADER = 'Utility ID'
+UTILITY_TEXT_ROWS = ('Utility type', 'Ultimate fuel source')
+UTILITY_NUMERIC_ROWS = ('Mass flow', 'Duty')
+
+# flows: one row per stream (index 'Stream Name') and one column per table row; units: unit of each table row
+StreamTable = namedtuple('StreamTable', ['flows', 'units'])
+
+
+def _cell(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+# rows of the sheet, read with the read-only (streaming) reader of openpyxl
+def _xlsx_rows(content, sheet_name=None):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name in workbook.sheetnames else workbook.worksheets[0]
+        for row in sheet.iter_rows(values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def _csv_rows(content):
+    text = content.decode('utf-8-sig')
+    dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    yield from csv.reader(io.StringIO(text), dialect)
+
+
+# the header row, then only the requested rows: parquet is columnar, the filter is vectorized
+def _parquet_rows(content, header, labels):
+    df = pd.read_parquet(io.BytesIO(content))
+    label_column = header if header in df.columns else df.columns[0]
+    yield tuple(df.columns)
+    yield from df.loc[df[label_column].isin(labels)].itertuples(index=False, name=None)
+
+
+def _rows(content, filename, sheet_name, header, labels):
+    name = filename.lower()
+    if name.endswith(('.xlsx', '.xlsm')):
+        return _xlsx_rows(content, sheet_name)
+    if name.endswith(('.csv', '.txt')):
+        return _csv_rows(content)
+    if name.endswith('.parquet'):
+        return _parquet_rows(content, header, labels)
+    raise ValueError(f'Unsupported file type: {filename}. Upload an .xlsx, .csv or .parquet export')
+
+
+# read only the given rows of a stream table.
+# The label column is the one holding the header, units are in the next column and streams in the following ones.
+# The first occurrence of each label is kept and the reading stops as soon as all of them are found.
+# Optional (numeric) rows that are not in the table are left empty
+def read_stream_table(content, filename, header, text_rows, numeric_rows, sheet_name=None, optional_rows=()):
+    numeric_rows = tuple(numeric_rows) + tuple(optional_rows)
+    labels = tuple(text_rows) + numeric_rows
+    label_col = None
+    positions, names = [], []
+    values, units = {}, {}
+
+    for row in _rows(content, filename, sheet_name, header, labels):
+        row = [_cell(value) for value in row]
+        if label_col is None:
+            if header in row:
+                label_col = row.index(header)
+                for position in range(label_col + 2, len(row)):
+                    if row[position] is not None:
+                        positions.append(position)
+                        names.append(str(row[position]))
+            continue
+        label = row[label_col] if label_col < len(row) else None
+        if label in labels and label not in values:
+            values[label] = [row[position] if position < len(row) else None for position in positions]
+            units[label] = row[label_col + 1] if label_col + 1 < len(row) else None
+            if len(values) == len(labels):
+                break
+
+    if label_col is None:
+        raise ValueError(f"'{header}' not found in {filename}")
+    missing = [label for label in labels if label not in values and label not in optional_rows]
+    if missing:
+        raise ValueError(f"Row(s) not found in {filename}: {', '.join(missing)}")
+
+    flows = pd.DataFrame(values, index=pd.Index(names, name='Stream Name'), columns=list(labels))
+    for label in optional_rows:
+        units.setdefault(label, None)
+    for label in numeric_rows:
+        flows[label] = pd.to_numeric(flows[label], errors='coerce')
+    return StreamTable(flows, units)
+
+
+def read_material_table(content, filename):
+    return read_stream_table(
+        content, filename, MATERIAL_HEADER, MATERIAL_TEXT_ROWS, MATERIAL_NUMERIC_ROWS, sheet_name='Material',
+        optional_rows=MATERIAL_OPTIONAL_ROWS,
+    )
+
+
+def read_utility_table(content, filename):
+    return read_stream_table(content, filename, UTILITY_HEADER, UTILITY_TEXT_ROWS, UTILITY_NUMERIC_ROWS)
@@ -0,0 +1,9 @@
+// callbacks that only show or hide parts of the layout: they run in the browser, without a round-trip to the server
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    layout: {
+        // sections that are available once the streams are mapped (an lca setup is stored)
+        showWithSetup: function (setup) {
+            return {display: setup ? 'block' : 'none'};
+        },
+    },
+});
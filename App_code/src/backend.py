@@ -0,0 +1,165 @@
+# brightway objects and shared engines of the app, created on first use from the configuration (config.py)
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+
+import config
+from timing import logger, startup_report, timed
+
+_state = {}
+_lock = threading.RLock()
+
+
+def _get(name, factory):
+    with _lock:
+        if name not in _state:
+            with timed(f'setup {name}'):
+                _state[name] = factory()
+        return _state[name]
+
+
+# jobs run in processes forked from the server: the locks held by its threads at the time of the fork
+# (e.g. the warm-up building the background model) would never be released in the child, so they are recreated
+def _after_fork():
+    global _lock
+    _lock = threading.RLock()
+    for obj in list(_state.values()):
+        if hasattr(obj, 'reset_locks'):
+            obj.reset_locks()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+# settings needed by the worker processes of the server (batch runs, Monte Carlo), with the shared folder
+def settings():
+    values = {name: getattr(config, name) for name in ('PROJECT', 'ECOINVENT', 'BIOSPHERE', 'METHOD_FAMILY', 'TEMPLATE_DIR')}
+    values['CACHE_DIR'] = work_dir()
+    return values
+
+
+# initializer of the worker processes, which get the settings of the parent even when they are spawned. A spawned
+# process starts in the default brightway project: the project of the settings is opened here
+def apply_settings(values):
+    for name, value in values.items():
+        setattr(config, name, value)
+    project()
+
+
+def _set_project():
+    with timed('import bw2data'):
+        import bw2data as bd
+    bd.projects.set_current(config.PROJECT)
+    return bd.projects.current
+
+
+def project():
+    return _get('project', _set_project)
+
+
+def ecoinvent():
+    project()
+    import bw2data as bd
+    return _get('ecoinvent', lambda: bd.Database(config.ECOINVENT))
+
+
+def biosphere():
+    project()
+    import bw2data as bd
+    return _get('biosphere', lambda: bd.Database(config.BIOSPHERE))
+
+
+# impact assessment methods used for the computation of LCA impacts
+def methods():
+    project()
+    import bw2data as bd
+    return _get('methods', lambda: [met for met in bd.methods if met[0] == config.METHOD_FAMILY])
+
+
+def database_versions():
+    project()
+    import bw2data as bd
+    return {db.name: bd.databases[db.name].get('modified') for db in (ecoinvent(), biosphere())}
+
+
+# folder shared by the server and its job processes: the cache folder, or a temporary one removed at exit.
+# The temporary folder is passed on to the processes started by the server through the environment
+def work_dir():
+    def create():
+        if config.CACHE_DIR:
+            os.makedirs(config.CACHE_DIR, exist_ok=True)
+            return config.CACHE_DIR
+        path = tempfile.mkdtemp(prefix='aspen-x-bw-')
+        os.environ['ASPENBW_CACHE_DIR'] = path
+        pid = os.getpid()
+        atexit.register(lambda: os.getpid() == pid and shutil.rmtree(path, ignore_errors=True))
+        return path
+    return _get('work_dir', create)
+
+
+# LCA results shared by all the users of the server, for every method
+def result_cache():
+    from cache import ResultCache
+    return _get('result_cache', lambda: ResultCache(directory=work_dir(), name='results'))
+
+
+# server-side data of the dcc.Store components, on disk so that the jobs can hand back their results
+def session_store():
+    from store import SessionStore
+    return _get('session_store', lambda: SessionStore(directory=os.path.join(work_dir(), 'sessions')))
+
+
+# background model of ecoinvent with the technosphere factorized once
+def lca_pool():
+    def create():
+        with timed('import bw2calc'):
+            from pool import LCAPool
+        return LCAPool(directory=os.path.join(work_dir(), 'matrices'))
+    return _get('lca_pool', create)
+
+
+# mapping templates saved by the users
+def template_store():
+    from templates import TemplateStore
+    return _get('template_store', lambda: TemplateStore(config.TEMPLATE_DIR))
+
+
+# Aspen exports of the watched folder, None without a watched folder
+def watch_folder():
+    if config.WATCH_DIR is None:
+        return None
+    from watch import WatchFolder
+    return _get('watch_folder', lambda: WatchFolder(config.WATCH_DIR))
+
+
+# in-memory search index and node metadata of the databases
+def catalog():
+    project()
+    from catalog import Catalog
+    return _get('catalog', Catalog)
+
+
+# search indexes first, then the background model and the unit impacts of every ecoinvent activity
+def warm_up():
+    try:
+        with timed('load ecoinvent catalog'):
+            catalog().load(ecoinvent().name)
+        with timed('load biosphere catalog'):
+            catalog().load(biosphere().name)
+        with timed('prepare background model'):
+            lca_pool().get(ecoinvent().name, methods())
+        with timed('unit impacts'):
+            lca_pool().build_unit_impacts(ecoinvent().name, methods())
+    except Exception:
+        logger.exception('Warm-up failed, the databases will be loaded on first use')
+    logger.info('Startup profile:\n%s', startup_report())
+
+
+# the layout is served while the warm-up runs
+def start_warm_up():
+    thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,159 @@
+# headless Aspen-to-LCA runs: the impacts of many cases (materials, utilities and mapping files) computed in parallel.
+#
+#   python batch.py --materials "Materials.xlsx" --utilities "Utilities.xlsx" --mapping mapping.csv -o results
+#   python batch.py --cases cases.csv --workers 8 -o results
+#   python batch.py --materials "Materials.xlsx" --mapping mapping.csv --sweep sweep.csv -o results
+#
+# A cases file has one row per case with the columns case, materials, utilities (optional) and mapping,
+# paths being relative to the cases file. A mapping file has the columns Stream Name, Type and Activity (code).
+# A sweep table has one row per case of a single Aspen run and one column per stream with its flow (see read_sweep_table)
+import argparse
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import backend
+import config
+from pipeline import (
+    apply_mapping, changed_units, lca_results, lca_setup, read_mapping, read_streams, read_sweep_table, sweep_results,
+    sweep_setups,
+)
+from timing import logger, timed
+
+RESULT_FORMATS = ('csv', 'xlsx', 'parquet')
+
+
+def _mapped_streams(materials, utilities, mapping):
+    if mapping is None:
+        raise ValueError('A mapping of the streams is needed')
+    if isinstance(mapping, str):
+        mapping = read_mapping(mapping)
+    in_df, out_df, util_df = apply_mapping(*read_streams(materials, utilities), mapping)
+    nodes = backend.catalog().resolve(pd.concat([in_df, out_df, util_df])['Activity'].dropna())
+    changed = changed_units(mapping, nodes)
+    if changed:
+        raise ValueError(f"Unit of the activity changed since the mapping was saved: {', '.join(changed)}")
+    return in_df, out_df, util_df, nodes
+
+
+# impacts of one case: the long table of the app (stream x category), the total of each category
+# and the top upstream contributions
+def run_case(materials, utilities=None, mapping=None):
+    in_df, out_df, util_df, nodes = _mapped_streams(materials, utilities, mapping)
+    lca_df, total, contribution_df = lca_results(lca_setup(in_df, out_df, util_df, nodes))
+    return lca_df, pd.Series(total, index=[met[1] for met in backend.methods()]), contribution_df
+
+
+# total impacts (cases x categories) of the cases of a sweep table, all solved together
+def run_sweep(materials, utilities=None, mapping=None, sweep_table=None):
+    in_df, out_df, util_df, nodes = _mapped_streams(materials, utilities, mapping)
+    with open(sweep_table, 'rb') as f:
+        cases = read_sweep_table(f.read(), os.path.basename(sweep_table))
+    return sweep_results(sweep_setups(in_df, out_df, util_df, nodes, cases), list(cases.index))
+
+
+def write_results(lca_df, path):
+    if path.endswith('.xlsx'):
+        lca_df.to_excel(path, index=False)
+    elif path.endswith('.parquet'):
+        lca_df.to_parquet(path, index=False)
+    else:
+        lca_df.to_csv(path, index=False)
+
+
+def read_cases(path):
+    table = pd.read_excel(path) if path.lower().endswith(('.xlsx', '.xlsm')) else pd.read_csv(path, sep=None, engine='python')
+    folder = os.path.dirname(os.path.abspath(path))
+
+    def file(value):
+        return os.path.join(folder, value) if isinstance(value, str) and value else None
+
+    cases = []
+    for row in table.to_dict('records'):
+        case = {column: file(row.get(column)) for column in ('materials', 'utilities', 'mapping')}
+        case['case'] = str(row['case']) if 'case' in row else os.path.splitext(os.path.basename(case['materials']))[0]
+        cases.append(case)
+    return cases
+
+
+def _run(case, output_dir, result_format):
+    lca_df, total, contribution_df = run_case(case['materials'], case['utilities'], case['mapping'])
+    write_results(lca_df, os.path.join(output_dir, f"{case['case']}.{result_format}"))
+    write_results(contribution_df, os.path.join(output_dir, f"{case['case']}-contributions.{result_format}"))
+    return total
+
+
+# run the cases over a process pool and write one result file per case and a summary of the totals (case x category).
+# The background model is prepared once before the workers start: forked workers inherit it,
+# the others memory-map the copy saved in the cache folder
+def run_batch(cases, output_dir, workers=None, result_format='csv'):
+    os.makedirs(output_dir, exist_ok=True)
+    with timed('prepare background model'):
+        backend.catalog().load(backend.ecoinvent().name)
+        backend.catalog().load(backend.biosphere().name)
+        backend.lca_pool().get(backend.ecoinvent().name, backend.methods())
+        backend.lca_pool().build_unit_impacts(backend.ecoinvent().name, backend.methods())
+
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+
+    totals, errors = {}, {}
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=backend.apply_settings, initargs=(backend.settings(),)) as executor:
+        futures = {executor.submit(_run, case, output_dir, result_format): case['case'] for case in cases}
+        for done, future in enumerate(as_completed(futures), start=1):
+            name = futures[future]
+            try:
+                totals[name] = future.result()
+            except Exception as e:
+                errors[name] = str(e)
+                logger.error('Case %s failed: %s', name, e)
+            logger.info('%d/%d cases done', done, len(futures))
+
+    summary = pd.DataFrame.from_dict(totals, orient='index').reindex([case['case'] for case in cases])
+    summary.index.name = 'case'
+    summary['error'] = pd.Series(errors, dtype=object)
+    summary.to_csv(os.path.join(output_dir, 'summary.csv'))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Aspen Plus x Brightway 2.5 batch runs')
+    config.add_arguments(parser, server=False)
+    parser.add_argument('--cases', help='table of cases (case, materials, utilities, mapping)')
+    parser.add_argument('--materials', help='material stream table of a single case')
+    parser.add_argument('--utilities', help='utility table of a single case')
+    parser.add_argument('--mapping', help='mapping of the streams of a single case')
+    parser.add_argument('--sweep', help='table of flows of the streams of a single case (one row per sweep case)')
+    parser.add_argument('-o', '--output', default='results', help='folder of the result files')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: number of CPUs)')
+    parser.add_argument('--format', choices=RESULT_FORMATS, default='csv', help='format of the result files')
+    args = parser.parse_args(argv)
+    config.apply_args(args)
+
+    if args.sweep:
+        if not (args.materials and args.mapping):
+            parser.error('a sweep needs the materials and mapping files of the case')
+        os.makedirs(args.output, exist_ok=True)
+        summary = run_sweep(args.materials, args.utilities, args.mapping, args.sweep)
+        summary.to_csv(os.path.join(args.output, 'sweep.csv'))
+        print(summary.to_string())
+        return 0
+
+    if args.cases:
+        cases = read_cases(args.cases)
+    elif args.materials and args.mapping:
+        name = os.path.splitext(os.path.basename(args.materials))[0]
+        cases = [{'case': name, 'materials': args.materials, 'utilities': args.utilities, 'mapping': args.mapping}]
+    else:
+        parser.error('give a cases table, or the materials and mapping files of a case')
+
+    summary = run_batch(cases, args.output, workers=args.workers, result_format=args.format)
+    print(summary.to_string())
+    return 1 if summary['error'].notna().any() else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
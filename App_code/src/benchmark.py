@@ -0,0 +1,261 @@
+# benchmarks of the app on a synthetic project shaped like ecoinvent (see synthetic.py), without a licence or a browser:
+# the callbacks are called as Dash would, on synthetic Aspen exports, and timed.
+#
+#   python benchmark.py                                     # 20k activities, 4k flows, 16 methods, 200 streams
+#   python benchmark.py --streams 1000 --repeat 5 -o benchmark.json
+#   python benchmark.py --save-baseline baseline.json       # keep the timings and scores of this machine
+#   python benchmark.py --baseline baseline.json            # compare with them, exit code 1 on a regression
+#
+# The project is generated once in the brightway project --project (about a minute), and kept for the next runs.
+# Every run uses a new cache folder, so the first LCA of a run is computed from scratch.
+# The scores of the categories are compared with the baseline too: a change of results fails the comparison
+import argparse
+import base64
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+import config
+import synthetic
+from pipeline import set_stream_type
+from timing import logger
+
+# steps of a run, in order. Steps timed once are the cold ones (first load or computation of a run)
+STEPS = [
+    'load catalogs', 'prepare background model', 'unit impacts',
+    'upload materials', 'upload utilities', 'build grid', 'lca_calc',
+    'update_graph (computed)', 'show_results (cached)', 'update_graph (one stream remapped)',
+    'search activities', 'search elementary flows',
+    'export csv', 'export parquet', 'export xlsx',
+]
+
+# words typed in the search box, letter by letter
+QUERIES = ['steel low', 'market for electricity', 'transport lorry', 'polyethylene granulate']
+FLOW_QUERIES = ['carbon dioxide fossil', 'methane', 'particulate matter']
+
+# a timing is a regression when it is slower than the baseline by this factor (and by MIN_DIFFERENCE seconds)
+TOLERANCE = 1.25
+MIN_DIFFERENCE = 0.01
+
+
+def _typed(queries):
+    return [query[:n] for query in queries for n in range(2, len(query) + 1)]
+
+
+def _upload(path):
+    with open(path, 'rb') as f:
+        return 'data:application/octet-stream;base64,' + base64.b64encode(f.read()).decode('ascii')
+
+
+# codes of the activities by unit and by whether they are waste treatments (negative production)
+def activities_by_unit(records):
+    codes = {}
+    for record in sorted(records, key=lambda record: record['code']):
+        codes.setdefault((record['unit'], (record.get('production amount') or 1) < 0), []).append(record['code'])
+    return codes
+
+
+# mapping of the grid: inputs to activities in kilogram (one in ten without impact), the first output as reference
+# flow and the others to waste treatments or by-products, utilities to energy activities
+def map_grid(grid, codes, seed=0):
+    rng = np.random.default_rng(seed)
+
+    def pick(unit, waste=False):
+        return codes[(unit, waste)][rng.integers(len(codes[(unit, waste)]))]
+
+    outputs = 0
+    for row, kind in zip(grid.index, grid['Stream']):
+        if kind == 'Input':
+            no_impact = rng.random() < 0.1
+            grid = set_stream_type(grid, row, 'No impact' if no_impact else 'Technosphere')
+            grid.at[row, 'Activity'] = None if no_impact else pick('kilogram')
+        elif kind == 'Output':
+            stream_type = 'Reference flow' if not outputs else 'Waste flow' if rng.random() < 0.6 else 'By-product'
+            grid = set_stream_type(grid, row, stream_type)
+            grid.at[row, 'Activity'] = pick('kilogram', waste=True) if stream_type == 'Waste flow' else None
+            outputs += 1
+        else:
+            grid.at[row, 'Activity'] = pick('megajoule' if rng.random() < 0.5 else 'kilowatt hour')
+    return grid
+
+
+def _timed(timings, step, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    timings.setdefault(step, []).append(time.perf_counter() - start)
+    return result
+
+
+# timings (seconds of each repetition, by step) and total scores (by category) of one run
+def run(streams=200, utilities=20, components=40, repeat=3, seed=0):
+    exports_dir = tempfile.mkdtemp(prefix='aspen-x-bw-benchmark-')
+    try:
+        materials, utility = synthetic.aspen_exports(exports_dir, streams, utilities, components, seed)
+        return _run(_upload(materials), os.path.basename(materials), _upload(utility), os.path.basename(utility),
+                    repeat, seed)
+    finally:
+        shutil.rmtree(exports_dir, ignore_errors=True)
+
+
+def _run(materials, materials_name, utility, utility_name, repeat, seed):
+    # the app is imported once the settings point to the synthetic project
+    import app
+    import backend
+    from export import export_file
+    from pipeline import lca_results, results_key, stream_results
+
+    timings = {}
+    ecoinvent, biosphere, methods = backend.ecoinvent(), backend.biosphere(), backend.methods()
+    _timed(timings, 'load catalogs', lambda: [backend.catalog().load(db.name) for db in (ecoinvent, biosphere)])
+    _timed(timings, 'prepare background model', backend.lca_pool().get, ecoinvent.name, methods)
+    _timed(timings, 'unit impacts', backend.lca_pool().build_unit_impacts, ecoinvent.name, methods)
+    store = backend.session_store()
+    codes = activities_by_unit(backend.catalog().index(ecoinvent.name).records)
+    kilogram_codes = codes[('kilogram', False)]
+    categories = [method[1] for method in methods]
+
+    def progress(values):
+        pass
+
+    for i in range(max(1, repeat)):
+        _, in_key, out_key, _ = _timed(timings, 'upload materials', app.materials_upload, materials, materials_name,
+                                       None)
+        _, util_key, _ = _timed(timings, 'upload utilities', app.utility_upload, utility, utility_name, None)
+        grid_key = _timed(timings, 'build grid', app.build_grid, in_key, out_key, util_key, None, None, None)[0]
+        grid = map_grid(store.get(grid_key), codes, seed)
+        grid_key = store.put(grid)
+        setup_key = _timed(timings, 'lca_calc', app.lca_calc, 1, grid_key, in_key, out_key, util_key)[0]
+
+        if i == 0:
+            _timed(timings, 'update_graph (computed)', app.update_graph, progress,
+                   {'setup': setup_key, 'category': categories[0]})
+            scores = stream_results(store.get(setup_key))[1]
+        _timed(timings, 'show_results (cached)', app.show_results, categories[i % len(categories)], setup_key)
+
+        # another activity for the first technosphere input (a new one at each repetition): one more supply to solve
+        row = grid.index[grid['Type'] == 'Technosphere'][0]
+        position = kilogram_codes.index(grid.at[row, 'Activity']) + i + 1
+        grid.at[row, 'Activity'] = kilogram_codes[position % len(kilogram_codes)]
+        grid_key = store.put(grid)
+        remapped_key = app.lca_calc(1, grid_key, in_key, out_key, util_key)[0]
+        _timed(timings, 'update_graph (one stream remapped)', app.update_graph, progress,
+               {'setup': remapped_key, 'category': categories[0]})
+
+        # the searches while the user types, without the results of the previous repetitions
+        backend.catalog().index(ecoinvent.name).search.cache_clear()
+        backend.catalog().index(biosphere.name).search.cache_clear()
+        _timed(timings, 'search activities',
+               lambda: [app.search_options(ecoinvent, query) for query in _typed(QUERIES)])
+        _timed(timings, 'search elementary flows',
+               lambda: [app.search_options(biosphere, query, detail='categories') for query in _typed(FLOW_QUERIES)])
+
+        client = app.server.test_client()
+        _timed(timings, 'export csv', lambda: client.get(f'/export/{setup_key}.csv').get_data())
+        setup_df = store.get(setup_key)
+        results = lca_results(setup_df)
+        export_dir = tempfile.mkdtemp(prefix='aspen-x-bw-exports-')
+        try:
+            for fmt in ('parquet', 'xlsx'):
+                _timed(timings, f'export {fmt}', export_file, results, results_key(setup_df), fmt, export_dir)
+        finally:
+            shutil.rmtree(export_dir, ignore_errors=True)
+
+    return timings, dict(zip(categories, (float(score) for score in scores)))
+
+
+# steps slower than the baseline (median over the repetitions) and categories whose score changed
+def compare(result, baseline, tolerance=TOLERANCE):
+    slower = {}
+    for step, times in result['timings'].items():
+        reference = baseline['timings'].get(step)
+        if not reference:
+            continue
+        median, reference = statistics.median(times), statistics.median(reference)
+        if median > reference * tolerance and median - reference > MIN_DIFFERENCE:
+            slower[step] = (median, reference)
+    changed = {
+        category: (score, baseline['scores'].get(category))
+        for category, score in result['scores'].items()
+        if not np.isclose(score, baseline['scores'].get(category, np.nan), rtol=1e-6, atol=0)
+    }
+    return slower, changed
+
+
+def report(result, baseline=None):
+    lines = [f"{'step':<36} {'median [s]':>11} {'min [s]':>9} {'baseline [s]':>13} {'ratio':>7}"]
+    for step in STEPS:
+        times = result['timings'].get(step)
+        if not times:
+            continue
+        median = statistics.median(times)
+        reference = statistics.median(baseline['timings'][step]) if baseline and baseline['timings'].get(step) else None
+        columns = f'{reference:>13.4f} {median / reference:>7.2f}' if reference else f"{'':>13} {'':>7}"
+        lines.append(f'{step:<36} {median:>11.4f} {min(times):>9.4f} {columns}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Aspen Plus x Brightway 2.5 benchmarks on a synthetic project')
+    parser.add_argument('--project', default='aspenbw-synthetic', help='brightway project of the synthetic databases')
+    parser.add_argument('--activities', type=int, default=20000, help='activities of the synthetic ecoinvent')
+    parser.add_argument('--flows', type=int, default=4000, help='elementary flows of the synthetic biosphere')
+    parser.add_argument('--methods', type=int, default=16, help='impact categories of the synthetic method family')
+    parser.add_argument('--streams', type=int, default=200, help='material streams of the synthetic Aspen export')
+    parser.add_argument('--utilities', type=int, default=20, help='utilities of the synthetic Aspen export')
+    parser.add_argument('--components', type=int, default=40, help='components of the material streams')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions of the steps that are not cold')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='JSON file of the timings and scores of the run')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare with')
+    parser.add_argument('--save-baseline', help='JSON file where the run is saved as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='slowdown factor counted as a regression')
+    args = parser.parse_args(argv)
+
+    if synthetic.ensure_project(args.project, args.activities, args.flows, args.methods, args.seed):
+        logger.info('Synthetic project %s generated', args.project)
+    config.PROJECT, config.ECOINVENT, config.BIOSPHERE = args.project, synthetic.ECOINVENT, synthetic.BIOSPHERE
+    config.METHOD_FAMILY, config.CACHE_DIR, config.WARM_UP = synthetic.METHOD_FAMILY, None, False
+
+    timings, scores = run(args.streams, args.utilities, args.components, args.repeat, args.seed)
+    result = {
+        'parameters': {
+            **synthetic.project_parameters(args.activities, args.flows, args.methods, args.seed),
+            'streams': args.streams, 'utilities': args.utilities, 'components': args.components,
+        },
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'timings': timings,
+        'scores': scores,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['parameters'] != result['parameters']:
+            logger.warning('The baseline was run with other parameters: %s', baseline['parameters'])
+    print(report(result, baseline))
+    if baseline is None:
+        return 0
+
+    slower, changed = compare(result, baseline, args.tolerance)
+    for step, (median, reference) in slower.items():
+        print(f'Regression: {step} takes {median:.4f} s instead of {reference:.4f} s')
+    for category, (score, reference) in changed.items():
+        print(f'Changed score: {category} is {score:.6g} instead of {reference}')
+    return 1 if slower or changed else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+# content-addressed cache for LCA results, shared by all the sessions of the server
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import metrics
+
+
+# key of a computation: the normalized lca setup records, the database versions and the method set.
+# Records are sorted so that the same mapping gives the same key whatever the order of the streams
+def setup_key(records, database_versions, methods):
+    rows = sorted(
+        (json.dumps(record, sort_keys=True, default=str) for record in records or []),
+    )
+    payload = json.dumps(
+        {
+            'setup': rows,
+            'databases': sorted(database_versions.items()),
+            'methods': [list(method) for method in methods],
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# puts of a ResultCache between two scans of its directory (see _wrote)
+DISK_SCAN_PUTS = 64
+# share of the disk budget left once a directory over its budget is trimmed
+DISK_TRIM_RATIO = 0.9
+
+
+# in-process LRU bounded by number of items and total pickled size,
+# with an optional directory where the results survive a restart of the server.
+# A named cache reports its lookups and the size of the values put in it (see metrics.py)
+class ResultCache:
+    def __init__(self, max_items=128, max_bytes=256 * 2**20, directory=None, max_disk_bytes=2 * 2**30, name=None):
+        self.name = name
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._size = 0
+        self._disk_size = None
+        self._puts = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def reset_locks(self):
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    def get(self, key):
+        value = self._get(key)
+        if self.name is not None:
+            metrics.increment('cache_requests_total', cache=self.name, result='miss' if value is None else 'hit')
+        return value
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+
+        if self.directory is not None and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key), 'rb') as f:
+                    blob = f.read()
+                value = pickle.loads(blob)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                value = None
+            if value is not None:
+                os.utime(self._path(key))
+                self._remember(key, value, len(blob))
+                with self._lock:
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.name is not None:
+            metrics.observe('payload_bytes', len(blob), cache=self.name)
+        self._remember(key, value, len(blob))
+        if self.directory is not None:
+            tmp_path = f'{self._path(key)}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_path, self._path(key))
+            self._wrote(len(blob))
+
+    def _remember(self, key, value, size):
+        # values larger than the whole memory budget only live on disk
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._size -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self._size += size
+            while len(self._items) > self.max_items or self._size > self.max_bytes:
+                _, (_, old_size) = self._items.popitem(last=False)
+                self._size -= old_size
+
+    # the size of the directory is counted up as the files are written, and only scanned again (with the files written
+    # by the other processes) when it goes over the budget or every DISK_SCAN_PUTS puts
+    def _wrote(self, size):
+        with self._lock:
+            self._puts += 1
+            if self._disk_size is not None and self._puts % DISK_SCAN_PUTS \
+                    and self._disk_size + size <= self.max_disk_bytes:
+                self._disk_size += size
+                return
+        self._trim_disk()
+
+    # least recently used files are removed once the directory is over its budget, down to DISK_TRIM_RATIO of it so
+    # that the next puts do not scan it again
+    def _trim_disk(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries) if total > self.max_disk_bytes else ():
+            if total <= self.max_disk_bytes * DISK_TRIM_RATIO:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        with self._lock:
+            self._disk_size = total
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._items:
+                return True
+        return self.directory is not None and os.path.exists(self._path(key))
+
+    def __len__(self):
+        return len(self._items)
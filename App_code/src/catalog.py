@@ -0,0 +1,193 @@
+# in-memory catalog of the nodes of the databases, loaded with one bulk query and searched without SQLite
+import bisect
+import re
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+# fields of the node data kept in the catalog
+NODE_FIELDS = ('name', 'reference product', 'location', 'categories', 'unit', 'production amount', 'type')
+
+# fields searched by the index
+SEARCH_FIELDS = ('name', 'reference product', 'location', 'categories')
+
+TOKEN_RE = re.compile(r'[\w.]+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def _query_nodes(condition):
+    from bw2data.backends import ActivityDataset as AD
+
+    query = AD.select(AD.id, AD.code, AD.database, AD.data).where(condition(AD))
+    records = []
+    for act_id, code, database, data in query.tuples():
+        record = {field: data.get(field) for field in NODE_FIELDS}
+        record['id'] = act_id
+        record['code'] = code
+        record['database'] = database
+        records.append(record)
+    return records
+
+
+# node records of a database with one query, instead of loading node by node
+def load_nodes(database):
+    return _query_nodes(lambda AD: AD.database == database)
+
+
+# node records of the given codes, in any database, with one query
+def load_nodes_by_code(codes):
+    return _query_nodes(lambda AD: AD.code.in_(list(codes)))
+
+
+# node records of the given ids with one query per batch of ids (SQLite limits the number of query parameters)
+def load_nodes_by_id(ids, batch_size=900):
+    ids = list(ids)
+    records = []
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        records.extend(_query_nodes(lambda AD: AD.id.in_(batch)))
+    return records
+
+
+# unit of an impact assessment method, read once from bd.methods
+@lru_cache(maxsize=None)
+def method_unit(method):
+    import bw2data as bd
+
+    return str(bd.methods[method]['unit'])
+
+
+# prefix and trigram index over the searched fields, with an LRU of the query results
+class SearchIndex:
+    def __init__(self, records, cache_size=4096):
+        self.records = records
+        postings = defaultdict(list)
+        self.name_tokens = []
+        for i, record in enumerate(records):
+            tokens = set()
+            for field in SEARCH_FIELDS:
+                value = record.get(field)
+                if isinstance(value, (tuple, list)):
+                    value = ' '.join(map(str, value))
+                if value:
+                    tokens.update(tokenize(value))
+            for token in tokens:
+                postings[token].append(i)
+            self.name_tokens.append(set(tokenize(record.get('name') or '')))
+
+        self.vocabulary = sorted(postings)
+        self.postings = [np.array(postings[token], dtype=np.int32) for token in self.vocabulary]
+        trigrams = defaultdict(set)
+        for t, token in enumerate(self.vocabulary):
+            for k in range(len(token) - 2):
+                trigrams[token[k:k + 3]].add(t)
+        self.trigrams = dict(trigrams)
+        self.search = lru_cache(maxsize=cache_size)(self._search)
+
+    # vocabulary positions of the tokens starting with the query token, or containing it (trigrams)
+    def _matching_tokens(self, query_token):
+        start = bisect.bisect_left(self.vocabulary, query_token)
+        end = bisect.bisect_left(self.vocabulary, query_token + '\uffff')
+        matches = set(range(start, end))
+        if len(query_token) >= 3:
+            candidates = None
+            for k in range(len(query_token) - 2):
+                found = self.trigrams.get(query_token[k:k + 3], set())
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    break
+            matches.update(t for t in candidates or () if query_token in self.vocabulary[t])
+        return matches
+
+    # records matching every token of the query, the ones matching in the name first
+    def _search(self, query, limit=50):
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return ()
+        selected = None
+        for query_token in query_tokens:
+            matches = self._matching_tokens(query_token)
+            if not matches:
+                return ()
+            found = np.unique(np.concatenate([self.postings[t] for t in matches]))
+            selected = found if selected is None else np.intersect1d(selected, found, assume_unique=True)
+            if not len(selected):
+                return ()
+
+        def rank(i):
+            name_tokens = self.name_tokens[i]
+            exact = sum(token in name_tokens for token in query_tokens)
+            prefix = sum(any(name.startswith(token) for name in name_tokens) for token in query_tokens)
+            return (-exact, -prefix, len(self.records[i].get('name') or ''))
+
+        best = sorted(selected.tolist(), key=rank)[:limit]
+        return tuple(self.records[i] for i in best)
+
+
+# catalogs of the databases used by the app, built in the background and shared by all the sessions.
+# Besides the search indexes, the catalog is the code -> node metadata table used by the callbacks
+class Catalog:
+    def __init__(self):
+        self._indexes = {}
+        self._nodes = {}
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def reset_locks(self):
+        self._lock = threading.Lock()
+
+    def load(self, database):
+        records = load_nodes(database)
+        index = SearchIndex(records)
+        with self._lock:
+            self._indexes[database] = index
+            self._nodes.update((record['code'], record) for record in records)
+            self._ids.update((record['id'], record) for record in records)
+        return index
+
+    # metadata of many nodes (id, unit, reference product, production amount, location, ...) keyed by code.
+    # Codes of databases that are not loaded yet are fetched together with one query and kept
+    def resolve(self, codes):
+        codes = {code for code in codes if code is not None}
+        with self._lock:
+            found = {code: self._nodes[code] for code in codes if code in self._nodes}
+        missing = codes.difference(found)
+        if missing:
+            records = load_nodes_by_code(missing)
+            with self._lock:
+                for record in records:
+                    self._nodes[record['code']] = record
+                    self._ids[record['id']] = record
+                    found[record['code']] = record
+            unknown = missing.difference(found)
+            if unknown:
+                raise KeyError(f'Unknown node code(s): {", ".join(sorted(unknown))}')
+        return found
+
+    # metadata of many nodes keyed by id (upstream processes and elementary flows of the contribution analysis).
+    # Ids that are not in the database are left out
+    def resolve_ids(self, ids):
+        ids = {int(node_id) for node_id in ids}
+        with self._lock:
+            found = {node_id: self._ids[node_id] for node_id in ids if node_id in self._ids}
+        missing = ids.difference(found)
+        if missing:
+            records = load_nodes_by_id(missing)
+            with self._lock:
+                for record in records:
+                    self._nodes[record['code']] = record
+                    self._ids[record['id']] = record
+                    found[record['id']] = record
+        return found
+
+    def node(self, code):
+        return self.resolve([code])[code]
+
+    # search index of the database, or None while it is still loading
+    def index(self, database):
+        return self._indexes.get(database)
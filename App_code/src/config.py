@@ -0,0 +1,64 @@
+# settings of the app: environment variables (ASPENBW_*), overridden by the command line when app.py is run directly
+import argparse
+import os
+
+# brightway project with ecoinvent
+PROJECT = os.environ.get('ASPENBW_PROJECT', '<name of your project with ecoinvent>')
+# ecoinvent and biosphere databases of the project
+ECOINVENT = os.environ.get('ASPENBW_ECOINVENT', '<ecoinvent database name>')
+BIOSPHERE = os.environ.get('ASPENBW_BIOSPHERE', '<biosphere database name>')
+# impact assessment methods used for the computation of LCA impacts: all the methods of this family
+METHOD_FAMILY = os.environ.get('ASPENBW_METHOD', 'EF v3.1')
+# folder where results and matrices are kept between restarts (None: memory only)
+CACHE_DIR = os.environ.get('ASPENBW_CACHE_DIR') or None
+# folder of the mapping templates
+TEMPLATE_DIR = os.environ.get('ASPENBW_TEMPLATE_DIR') or os.path.join(os.path.expanduser('~'), '.aspen-x-bw', 'templates')
+# load the databases and the matrices in the background as soon as the app starts
+WARM_UP = os.environ.get('ASPENBW_WARM_UP', '1').lower() not in ('0', 'false', 'no')
+# file where the metrics of the server are also written as JSON lines (None: no trace log, see metrics.py)
+TRACE_LOG = os.environ.get('ASPENBW_TRACE_LOG') or None
+# folder watched for new Aspen exports, loaded and computed again in the open dashboards (None: no watched folder)
+WATCH_DIR = os.environ.get('ASPENBW_WATCH_DIR') or None
+# seconds between two looks of the dashboards at the watched folder
+WATCH_INTERVAL = float(os.environ.get('ASPENBW_WATCH_INTERVAL', '5'))
+# address of the development server
+HOST = os.environ.get('ASPENBW_HOST', '127.0.0.1')
+PORT = int(os.environ.get('ASPENBW_PORT', '8050'))
+
+
+# options of the settings; server=False leaves out the ones of the web server (warm-up, trace log, watched folder,
+# host and port)
+def add_arguments(parser, server=True):
+    parser.add_argument('--project', default=PROJECT, help='brightway project with ecoinvent')
+    parser.add_argument('--ecoinvent', default=ECOINVENT, help='ecoinvent database name')
+    parser.add_argument('--biosphere', default=BIOSPHERE, help='biosphere database name')
+    parser.add_argument('--method', default=METHOD_FAMILY, help='family of impact assessment methods, e.g. "EF v3.1"')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='folder where results and matrices are kept')
+    if server:
+        parser.add_argument('--no-warm-up', action='store_true', help='load databases and matrices only when first needed')
+        parser.add_argument('--trace-log', default=TRACE_LOG, help='file where the metrics are also written as JSON lines')
+        parser.add_argument('--watch-dir', default=WATCH_DIR, help='folder watched for new Aspen exports')
+        parser.add_argument('--host', default=HOST)
+        parser.add_argument('--port', type=int, default=PORT)
+
+
+def apply_args(args):
+    global PROJECT, ECOINVENT, BIOSPHERE, METHOD_FAMILY, CACHE_DIR, WARM_UP, TRACE_LOG, WATCH_DIR, HOST, PORT
+    PROJECT = args.project
+    ECOINVENT = args.ecoinvent
+    BIOSPHERE = args.biosphere
+    METHOD_FAMILY = args.method
+    CACHE_DIR = args.cache_dir
+    WARM_UP = WARM_UP and not getattr(args, 'no_warm_up', False)
+    TRACE_LOG = getattr(args, 'trace_log', TRACE_LOG)
+    WATCH_DIR = getattr(args, 'watch_dir', WATCH_DIR)
+    HOST = getattr(args, 'host', HOST)
+    PORT = getattr(args, 'port', PORT)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Aspen Plus x Brightway 2.5 app')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    apply_args(args)
+    return args
@@ -0,0 +1,87 @@
+# contribution analysis of the background: top upstream processes, elementary flows and regions of every category,
+# from the supply and the inventory of the process solve (no extra solve)
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from bw2analyzer import ContributionAnalysis
+
+# contributions (Process, Elementary flow or Region) listed for each category
+CONTRIBUTION_COLUMNS = ['Impact category', 'Contribution', 'Rank', 'Name', 'Location', 'Impact', 'Share']
+
+# number of contributions kept per category and kind
+TOP_N = 20
+
+
+# characterized inventory of the process split by activity (methods x activities) and by elementary flow
+# (methods x flows), with the node ids of the columns
+class UpstreamImpacts:
+    def __init__(self, processes, flows, activity_ids, flow_ids):
+        self.processes = processes
+        self.flows = flows
+        self.activity_ids = np.asarray(activity_ids)
+        self.flow_ids = np.asarray(flow_ids)
+
+
+# direct_impacts: (methods x activities) scores of one unit of each activity, i.e. characterization @ biosphere.
+# The process impacts scale its columns by the supply, the flow impacts scale the factors by the inventory
+def upstream_impacts(characterization, biosphere_matrix, supply, activity_ids, flow_ids, direct_impacts=None):
+    supply = np.asarray(supply, dtype=float).ravel()
+    if direct_impacts is None:
+        direct_impacts = characterization @ biosphere_matrix
+    processes = sparse.csr_matrix(direct_impacts).multiply(supply).toarray()
+    flows = sparse.csr_matrix(characterization).multiply(biosphere_matrix @ supply).toarray()
+    return UpstreamImpacts(processes, flows, activity_ids, flow_ids)
+
+
+def _process_name(node):
+    return f"{node.get('name')} | {node.get('reference product')}" if node.get('reference product') else node.get('name')
+
+
+def _flow_location(node):
+    categories = node.get('categories')
+    return '/'.join(categories) if isinstance(categories, (list, tuple)) else categories
+
+
+# long table of the top contributions of every method (see CONTRIBUTION_COLUMNS); regions sum the processes
+# by location. resolve_ids(ids) gives the node metadata (name, reference product, location, categories) of the ids
+def top_contributions(upstream, methods, resolve_ids, limit=TOP_N):
+    analysis = ContributionAnalysis()
+    active = np.flatnonzero(np.abs(upstream.processes).sum(axis=0))
+    emitted = np.flatnonzero(np.abs(upstream.flows).sum(axis=0))
+    nodes = resolve_ids(np.concatenate([upstream.activity_ids[active], upstream.flow_ids[emitted]]))
+
+    # (activities x regions) indicator of the locations of the active processes
+    locations = [nodes.get(int(act_id), {}).get('location') or 'unknown' for act_id in upstream.activity_ids[active]]
+    region_codes, regions = pd.factorize(pd.Series(locations, dtype=object))
+    indicator = sparse.csr_matrix((np.ones(len(active)), (np.arange(len(active)), region_codes)), shape=(len(active), len(regions)))
+    region_impacts = np.asarray(indicator.T @ upstream.processes[:, active].T).T
+
+    def rows(kind, values, describe):
+        total = values.sum()
+        for rank, (value, index) in enumerate(analysis.sort_array(values, limit=limit), start=1):
+            if value == 0:
+                break
+            name, location = describe(int(index))
+            yield kind, rank, name, location, value, value / total if total else np.nan
+
+    def process(i):
+        node = nodes.get(int(upstream.activity_ids[active[i]]), {})
+        return _process_name(node), node.get('location')
+
+    def flow(i):
+        node = nodes.get(int(upstream.flow_ids[emitted[i]]), {})
+        return node.get('name'), _flow_location(node)
+
+    def region(i):
+        return regions[i], regions[i]
+
+    records = []
+    for m, method in enumerate(methods):
+        for kind, values, describe in (
+            ('Process', upstream.processes[m, active], process),
+            ('Elementary flow', upstream.flows[m, emitted], flow),
+            ('Region', region_impacts[m], region),
+        ):
+            records.extend((method[1],) + row for row in rows(kind, values, describe))
+    return pd.DataFrame.from_records(records, columns=CONTRIBUTION_COLUMNS)
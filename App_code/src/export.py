@@ -0,0 +1,87 @@
+# exports of the LCA results written on the server from the cached results: CSV streamed in chunks,
+# Parquet and Excel (one sheet per category and the contributions) written once per result and served as files
+import os
+import re
+
+import pandas as pd
+
+# media type of each export format
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# tables of the results: impacts by stream (long table) and top contributions
+EXPORT_TABLES = ('streams', 'contributions')
+
+# rows of the CSV written per chunk
+CSV_CHUNK_ROWS = 10000
+
+
+# table of the results (lca_results) named by table
+def result_table(results, table):
+    lca_df, _, contribution_df = results
+    return contribution_df if table == 'contributions' else lca_df
+
+
+# CSV text of a table, chunk by chunk, so that the response starts before the whole table is written
+def csv_chunks(df, chunk_rows=CSV_CHUNK_ROWS):
+    yield df.iloc[:0].to_csv(index=False)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False)
+
+
+# valid and unique Excel sheet names (at most 31 characters, without []:*?/\)
+def sheet_names(names):
+    used = set()
+    result = []
+    for name in names:
+        base = re.sub(r'[\[\]:*?/\\]', '_', str(name))[:31] or 'Sheet'
+        sheet, i = base, 1
+        while sheet.lower() in used:
+            suffix = f' ({i})'
+            sheet, i = base[:31 - len(suffix)] + suffix, i + 1
+        used.add(sheet.lower())
+        result.append(sheet)
+    return result
+
+
+def _write_rows(sheet, df):
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        sheet.append([None if pd.isna(value) else value for value in row])
+
+
+# workbook with the impacts by stream of each category on its own sheet, then the contributions.
+# The write-only mode of openpyxl streams the rows to the file instead of keeping the cells in memory
+def write_excel(lca_df, contribution_df, path):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    groups = list(lca_df.groupby('Impact category', sort=False))
+    names = sheet_names([category for category, _ in groups] + ['Contributions'])
+    for (_, df), sheet_name in zip(groups, names):
+        _write_rows(workbook.create_sheet(sheet_name), df)
+    _write_rows(workbook.create_sheet(names[-1]), contribution_df)
+    workbook.save(path)
+
+
+# file of an export in directory, written once per result key (the results of a key do not change)
+def export_file(results, result_key, fmt, directory, table='streams'):
+    os.makedirs(directory, exist_ok=True)
+    name = f'{result_key}.{fmt}' if fmt == 'xlsx' else f'{result_key}-{table}.{fmt}'
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        return path
+    tmp_path = os.path.join(directory, f'.{os.getpid()}.tmp.{name}')
+    if fmt == 'xlsx':
+        lca_df, _, contribution_df = results
+        write_excel(lca_df, contribution_df, tmp_path)
+    elif fmt == 'parquet':
+        result_table(results, table).to_parquet(tmp_path, index=False)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.writelines(csv_chunks(result_table(results, table)))
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,216 @@
+# the Aspen process modelled as a foreground activity on top of the background databases
+import numpy as np
+
+import bw2data as bd
+import bw2calc as bc
+import bw_processing as bp
+from scipy.sparse.linalg import SuperLU
+
+try:
+    from pypardiso import spsolve
+except ImportError:
+    from scipy.sparse.linalg import spsolve
+
+from contribution import upstream_impacts
+from lcia import MethodStack
+from metrics import increment, phase
+from timing import logger
+
+# matrix id of the Aspen process, kept inside the int32 range of the bw_processing indices
+FOREGROUND_ID = int(np.iinfo(np.int32).max)
+
+
+# rows of the lca setup that are exchanges of the foreground activity:
+# the reference flow is the product of the process itself and unmapped streams are skipped
+def foreground_exchanges(setup_df):
+    exchanges = setup_df.dropna(subset=['Activity'])
+    return exchanges[exchanges['Type'] != 'Reference flow'].reset_index(drop=True)
+
+
+# uncertainty types of stats_arrays used for the Aspen flows
+NO_UNCERTAINTY = 0
+NORMAL_UNCERTAINTY = 3
+
+
+# in-memory datapackage with the foreground column: one unit of production and one input per stream.
+# Streams mapped to the same activity are summed in the matrix (sum_intra_duplicates).
+# relative_std (one value, or one per exchange) makes the amounts normally distributed, for Monte Carlo runs
+def foreground_datapackage(exchanges, activity_ids, relative_std=None):
+    indices = np.array(
+        [(act_id, FOREGROUND_ID) for act_id in activity_ids] + [(FOREGROUND_ID, FOREGROUND_ID)],
+        dtype=bp.INDICES_DTYPE,
+    )
+    data = np.append(exchanges['Amount'].to_numpy(dtype=float), 1.0)
+    flip = np.append(np.ones(len(exchanges), dtype=bool), False)
+
+    distributions = None
+    if relative_std is not None:
+        scale = np.append(np.abs(data[:-1]) * np.broadcast_to(relative_std, len(exchanges)), 0.0)
+        distributions = np.zeros(len(data), dtype=bp.UNCERTAINTY_DTYPE)
+        distributions['uncertainty_type'] = np.where(scale > 0, NORMAL_UNCERTAINTY, NO_UNCERTAINTY)
+        distributions['loc'] = data
+        distributions['scale'] = np.where(scale > 0, scale, np.nan)
+        distributions['shape'] = distributions['minimum'] = distributions['maximum'] = np.nan
+
+    dp = bp.create_datapackage(name='aspen-process', sum_intra_duplicates=True)
+    dp.add_persistent_vector(
+        matrix='technosphere_matrix',
+        name='aspen-process-technosphere',
+        indices_array=indices,
+        data_array=data,
+        flip_array=flip,
+        distributions_array=distributions,
+    )
+    return dp
+
+
+# node ids in the order of the rows or columns of a matrix, from its bw2calc dictionary
+def matrix_node_ids(mapping):
+    node_ids = np.empty(len(mapping), dtype=np.int64)
+    for node_id, index in mapping.items():
+        node_ids[index] = node_id
+    return node_ids
+
+
+# node ids of activity codes, one node at a time; the app passes the bulk resolver of its catalog instead
+def resolve_nodes(codes):
+    return {code: {'id': bd.get_node(code=code).id} for code in set(codes)}
+
+
+# solve against the technosphere already factorized by lci(factorize=True), for a demand vector or a matrix of
+# demands (one per column); bw2calc leaves no solver with PARDISO, which keeps its own factorization of the same matrix.
+# SuperLU solves all the columns in one call, the UMFPACK solver of scipy only takes one column at a time
+def solve(lca, demand):
+    if not hasattr(lca, 'solver'):
+        return spsolve(lca.technosphere_matrix, demand)
+    if demand.ndim == 2 and not isinstance(getattr(lca.solver, '__self__', None), SuperLU):
+        return np.column_stack([lca.solver(column) for column in demand.T])
+    return lca.solver(demand)
+
+
+# one LCA solve of the whole process for all methods.
+# The per-stream contributions split the supply vector by foreground input, reusing the factorized technosphere.
+# The precomputed unit-impact table (see unit_impacts.py) answers with a lookup when it covers every stream.
+# With a prepared background (see pool.py) the foreground column is solved against its persistent factorization:
+# nothing consumes the Aspen process, so its supply only needs the background block of the matrix,
+# and it is the sum of the unit supplies of the mapped activities kept by the background
+# resolve(codes) gives the node metadata (at least 'id') of the activity codes
+# progress(stage, done, total) is called as the streams are solved ('streams solved') and characterized
+# ('categories characterized')
+# Returns the foreground exchanges, the (streams x methods) contributions and the total scores.
+# With upstream=True the impacts of the upstream processes and elementary flows (see contribution.py) are returned
+# as fourth value, from the supply of the same solve: the unit-impact lookup is skipped since it has no supply
+def process_lca(setup_df, methods, background=None, unit_impacts=None, resolve=None, progress=None, upstream=False):
+    progress = progress or (lambda stage, done, total: None)
+    exchanges = foreground_exchanges(setup_df)
+    if exchanges.empty:
+        return (exchanges, np.zeros((0, len(methods))), np.zeros(len(methods))) + ((None,) if upstream else ())
+    nodes = (resolve or resolve_nodes)(exchanges['Activity'])
+    activity_ids = [nodes[code]['id'] for code in exchanges['Activity']]
+
+    # mapped streams are looked up in the precomputed unit impacts, no solve needed
+    if not upstream and unit_impacts is not None:
+        covered = unit_impacts.covers(activity_ids)
+        increment('cache_requests_total', cache='unit_impacts', result='hit' if covered else 'miss')
+        if covered:
+            with phase('characterization'):
+                contributions = unit_impacts.scores(activity_ids, exchanges['Amount'])
+            progress('categories characterized', len(methods), len(methods))
+            return exchanges, contributions, contributions.sum(axis=0)
+
+    # each stream is the unit supply of its activity times its amount: only the activities that the prepared
+    # background has not solved yet cost a solve, so an edit of the mapping re-solves at most the edited streams
+    if background is not None and background.covers(activity_ids):
+        unit_supply, solved = background.unit_supply(activity_ids)
+        supply = unit_supply * exchanges['Amount'].to_numpy(dtype=float)
+        logger.debug('%d of %d activities solved', solved, len(set(activity_ids)))
+        progress('streams solved', len(activity_ids), len(activity_ids))
+        with phase('characterization'):
+            contributions = background.method_stack.characterize(background.biosphere_matrix @ supply).T
+        progress('categories characterized', len(methods), len(methods))
+        if not upstream:
+            return exchanges, contributions, contributions.sum(axis=0)
+        with phase('upstream impacts'):
+            impacts = upstream_impacts(
+                background.method_stack.matrix, background.biosphere_matrix, supply.sum(axis=1),
+                background.activity_ids, background.flow_ids, direct_impacts=background.direct_impacts,
+            )
+        return exchanges, contributions, contributions.sum(axis=0), impacts
+
+    with phase('datapackage load'):
+        demand = {bd.get_node(id=act_id): 1 for act_id in set(activity_ids)}
+        _, data_objs, _ = bd.prepare_lca_inputs(demand=demand, method=methods[0], remapping=False)
+        lca = bc.LCA({FOREGROUND_ID: 1}, data_objs=data_objs + [foreground_datapackage(exchanges, activity_ids)])
+    with phase('matrix build'):
+        lca.load_lci_data()
+    # lci factorizes the matrix and solves the whole process
+    with phase('factorization'):
+        lca.lci(factorize=True)
+
+    with phase('characterization'):
+        method_stack = MethodStack(lca, methods)
+        total = method_stack.scores(lca)
+
+    # one solve of all the streams, each stream being a column of the demand
+    with phase('solve'):
+        demand = np.zeros((len(lca.demand_array), len(activity_ids)))
+        demand[[lca.dicts.product[act_id] for act_id in activity_ids], np.arange(len(activity_ids))] = \
+            exchanges['Amount'].to_numpy(dtype=float)
+        supply = solve(lca, demand)
+    progress('streams solved', len(activity_ids), len(activity_ids))
+    with phase('characterization'):
+        contributions = method_stack.characterize(lca.biosphere_matrix @ supply).T
+    progress('categories characterized', len(methods), len(methods))
+
+    if not upstream:
+        return exchanges, contributions, total
+    with phase('upstream impacts'):
+        impacts = upstream_impacts(
+            method_stack.matrix, lca.biosphere_matrix, lca.supply_array,
+            matrix_node_ids(lca.dicts.activity), matrix_node_ids(lca.dicts.biosphere),
+        )
+    return exchanges, contributions, total, impacts
+
+
+# scores of many variants of the process (one lca setup per case, with different amounts) for all methods.
+# Each case is one right-hand side: with the unit-impact table the scores are a matrix product, with a prepared
+# background all the cases are solved at once against its factorization, otherwise the technosphere of the mapped
+# activities is factorized once and each case costs one solve
+# Returns the (cases x methods) scores
+def sweep_lca(setups, methods, background=None, unit_impacts=None, resolve=None):
+    exchanges = [foreground_exchanges(setup_df) for setup_df in setups]
+    codes = set().union(*(set(case['Activity']) for case in exchanges))
+    if not codes:
+        return np.zeros((len(setups), len(methods)))
+    nodes = (resolve or resolve_nodes)(codes)
+    activity_ids = sorted({nodes[code]['id'] for code in codes})
+    rows = {act_id: i for i, act_id in enumerate(activity_ids)}
+
+    # (activities x cases) amounts, the streams mapped to the same activity are summed
+    amounts = np.zeros((len(activity_ids), len(setups)))
+    for k, case in enumerate(exchanges):
+        for code, amount in zip(case['Activity'], case['Amount']):
+            amounts[rows[nodes[code]['id']], k] += amount
+
+    if unit_impacts is not None and unit_impacts.covers(activity_ids):
+        impacts = unit_impacts.impacts[[unit_impacts.row_index[act_id] for act_id in activity_ids]]
+        return amounts.T @ np.asarray(impacts)
+
+    if background is not None and background.covers(activity_ids):
+        demand = np.zeros((len(background.product_ids), len(setups)))
+        demand[[background.product_index[act_id] for act_id in activity_ids]] = amounts
+        return background.scores(demand).T
+
+    demand = {bd.get_node(id=act_id): 1 for act_id in activity_ids}
+    _, data_objs, _ = bd.prepare_lca_inputs(demand=demand, method=methods[0], remapping=False)
+    lca = bc.LCA({activity_ids[0]: 1}, data_objs=data_objs)
+    lca.lci(factorize=True)
+    method_stack = MethodStack(lca, methods)
+    product_rows = [lca.dicts.product[act_id] for act_id in activity_ids]
+
+    scores = np.zeros((len(setups), len(methods)))
+    for k in range(len(setups)):
+        demand = np.zeros_like(lca.demand_array)
+        demand[product_rows] = amounts[:, k]
+        scores[k] = method_stack.characterize(lca.biosphere_matrix @ solve(lca, demand))
+    return scores
@@ -0,0 +1,31 @@
+# stacked characterization of several LCIA methods
+import numpy as np
+from scipy import sparse
+
+
+# all methods compiled once into a sparse (methods x biosphere flows) operator,
+# so that one inventory gives the scores of every category with one sparse product
+class MethodStack:
+    def __init__(self, lca, methods):
+        self.methods = list(methods)
+        rows = []
+        for method in self.methods:
+            lca.switch_method(method)
+            rows.append(sparse.csr_matrix(lca.characterization_matrix.diagonal()))
+        self.matrix = sparse.vstack(rows, format='csr')
+
+    # stack restored from an already compiled matrix
+    @classmethod
+    def from_matrix(cls, methods, matrix):
+        method_stack = cls.__new__(cls)
+        method_stack.methods = list(methods)
+        method_stack.matrix = sparse.csr_matrix(matrix)
+        return method_stack
+
+    # scores of all methods for a biosphere inventory vector (or matrix, one column per inventory)
+    def characterize(self, inventory):
+        return np.asarray(self.matrix @ inventory)
+
+    # scores of all methods for the supply vector currently held by the LCA object
+    def scores(self, lca):
+        return self.characterize(lca.biosphere_matrix @ lca.supply_array)
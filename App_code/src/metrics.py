@@ -0,0 +1,230 @@
+# metrics of the server: durations of the callbacks and of the phases of the LCA computations, sizes of the data kept
+# for the stores and caches, and lookups of the caches. They are added up in a diskcache of the shared folder, so that
+# the background jobs (run in their own processes) and the workers of a multi-worker server count together, and are
+# served in the Prometheus text format. Each process buffers its measures and adds them to the diskcache in one
+# transaction (see flush). With a trace log, every measure is also appended to it as a JSON line.
+# Nothing is recorded until enable() is called: the app does, batch runs do not
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from timing import logger
+
+PREFIX = 'aspenbw_'
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+# seconds between two flushes of the measures buffered by the process that enabled the metrics
+FLUSH_SECONDS = 5
+
+# type, description and buckets (histograms) of the metrics
+METRICS = {
+    'callback_seconds': ('histogram', 'Duration of the Dash callbacks by outcome', SECONDS_BUCKETS),
+    'phase_seconds': ('histogram', 'Duration of the phases of the LCA computations', SECONDS_BUCKETS),
+    'payload_bytes': ('histogram', 'Pickled size of the data put in the server-side stores and caches', BYTES_BUCKETS),
+    'response_bytes': ('histogram', 'Size of the callback responses sent to the browser', BYTES_BUCKETS),
+    'cache_requests_total': ('counter', 'Lookups of the caches by result (hit or miss)', None),
+}
+
+_state = {'directory': None, 'trace_log': None, 'pid': None, 'flushed': 0.0, 'callbacks': 0}
+_caches = {}
+# measures not yet added to the diskcache: (name, series, part) -> amount
+_pending = {}
+_lock = threading.Lock()
+
+
+def enable(directory, trace_log=None):
+    _state.update(directory=directory, trace_log=trace_log, pid=os.getpid(), flushed=time.monotonic())
+
+
+def enabled():
+    return _state['directory'] is not None
+
+
+# one diskcache per process: its sqlite connection is not shared with the processes forked from the server
+def _cache():
+    pid = os.getpid()
+    if pid not in _caches:
+        import diskcache
+        _caches.clear()
+        _caches[pid] = diskcache.Cache(_state['directory'])
+    return _caches[pid]
+
+
+def _series(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+# measures taken while serving a request also get the address of the client, to find slow users
+def _trace(name, value, labels):
+    if _state['trace_log'] is None:
+        return
+    event = {'time': round(time.time(), 3), 'pid': os.getpid(), 'metric': name, 'value': value, **labels}
+    flask = sys.modules.get('flask')
+    if flask is not None and flask.has_request_context():
+        event['client'] = flask.request.remote_addr
+    with open(_state['trace_log'], 'a', encoding='utf-8') as f:
+        f.write(json.dumps(event, default=str) + '\n')
+
+
+# the buffered measures added to the diskcache in one transaction
+def flush():
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _state['flushed'] = time.monotonic()
+    if not pending or not enabled():
+        return
+    try:
+        cache = _cache()
+        with cache.transact():
+            for key, amount in pending.items():
+                cache.incr(key, amount)
+    except Exception:
+        logger.warning('%d metrics not recorded', len(pending), exc_info=True)
+
+
+# the process that enabled the metrics flushes them every FLUSH_SECONDS and at exit. The background jobs and pool
+# workers forked from it end without running atexit: they flush at the end of each callback, and at once outside of one
+def _flush_due():
+    if os.getpid() != _state['pid']:
+        return not _state['callbacks']
+    return time.monotonic() - _state['flushed'] >= FLUSH_SECONDS
+
+
+# a forked process only flushes its own measures
+def _after_fork():
+    global _lock
+    _lock = threading.Lock()
+    _pending.clear()
+    _state['callbacks'] = 0
+
+
+atexit.register(flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _add(values, key, amount=1):
+    values[key] = values.get(key, 0) + amount
+
+
+# metrics never fail the computation they measure
+def _record(name, value, labels, update):
+    if not enabled():
+        return
+    try:
+        with _lock:
+            update(_pending, (name, _series(labels)))
+        _trace(name, value, labels)
+        if _flush_due():
+            flush()
+    except Exception:
+        logger.warning('Metric %s not recorded', name, exc_info=True)
+
+
+# value of a histogram (see METRICS), e.g. observe('phase_seconds', 0.2, phase='solve')
+def observe(name, value, **labels):
+    buckets = METRICS[name][2]
+    bucket = next((i for i, le in enumerate(buckets) if value <= le), len(buckets))
+
+    def update(values, key):
+        _add(values, key + ('bucket', bucket))
+        _add(values, key + ('count',))
+        _add(values, key + ('sum',), float(value))
+    _record(name, value, labels, update)
+
+
+def increment(name, amount=1, **labels):
+    if amount:
+        _record(name, amount, labels, lambda values, key: _add(values, key + ('total',), amount))
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('phase_seconds', time.perf_counter() - start, phase=name)
+
+
+# duration of a Dash callback, by outcome: ok, prevented (PreventUpdate) or error.
+# Goes right above the function, below the @callback decorator
+def instrumented(func):
+    from dash.exceptions import PreventUpdate
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = 'error'
+        with _lock:
+            _state['callbacks'] += 1
+        try:
+            result = func(*args, **kwargs)
+            outcome = 'ok'
+            return result
+        except PreventUpdate:
+            outcome = 'prevented'
+            raise
+        finally:
+            observe('callback_seconds', time.perf_counter() - start, callback=func.__name__, outcome=outcome)
+            with _lock:
+                _state['callbacks'] -= 1
+            if enabled() and _flush_due():
+                flush()
+    return wrapper
+
+
+def _labels_text(series):
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in series) + '}' if series else ''
+
+
+def _number(value):
+    return '+Inf' if value == float('inf') else f'{value:g}'
+
+
+# all the metrics in the Prometheus text exposition format, with the hit ratio of each cache. The other workers of the
+# server add their measures at their next flush
+def prometheus_text():
+    values = {}
+    if enabled():
+        flush()
+        cache = _cache()
+        values = {key: cache.get(key, 0) for key in cache.iterkeys()}
+
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        metric = PREFIX + name
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {kind}']
+        for series in sorted({key[1] for key in values if key[0] == name}):
+            if kind == 'counter':
+                lines.append(f"{metric}{_labels_text(series)} {values.get((name, series, 'total'), 0)}")
+                continue
+            cumulative = 0
+            for i, le in enumerate(buckets + (float('inf'),)):
+                cumulative += values.get((name, series, 'bucket', i), 0)
+                lines.append(f"{metric}_bucket{_labels_text(series + (('le', _number(le)),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels_text(series)} {values.get((name, series, 'sum'), 0):g}")
+            lines.append(f"{metric}_count{_labels_text(series)} {values.get((name, series, 'count'), 0)}")
+
+    requests = {}
+    for key, value in values.items():
+        if key[0] == 'cache_requests_total':
+            labels = dict(key[1])
+            requests.setdefault(labels.get('cache'), {})[labels.get('result')] = value
+    lines += [f'# HELP {PREFIX}cache_hit_ratio Share of the lookups of the caches that were hits',
+              f'# TYPE {PREFIX}cache_hit_ratio gauge']
+    for cache_name, counts in sorted(requests.items()):
+        total = counts.get('hit', 0) + counts.get('miss', 0)
+        if total:
+            lines.append(f"{PREFIX}cache_hit_ratio{_labels_text((('cache', cache_name),))} {counts.get('hit', 0) / total:g}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,180 @@
+# Monte Carlo uncertainty of the process: ecoinvent distributions (bw2calc) and normal uncertainty on the Aspen flows.
+# Iterations run in chunks over a process pool and are summarized as they complete (no sample is kept)
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+# percentiles reported for each category
+PERCENTILES = (2.5, 5, 25, 50, 75, 95, 97.5)
+
+
+# histogram over a range that grows with the samples: bins are merged two by two whenever a sample is out of range.
+# Memory does not depend on the number of samples, and percentiles are interpolated within the bins
+class StreamingHistogram:
+    def __init__(self, bins=64):
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.low = None
+        self.width = None
+
+    def _grow(self, up):
+        merged = self.counts[0::2] + self.counts[1::2]
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        if up:
+            self.counts[:self.bins // 2] = merged
+        else:
+            self.counts[self.bins // 2:] = merged
+            self.low -= self.bins * self.width
+        self.width *= 2
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        if self.low is None:
+            low, high = values.min(), values.max()
+            self.width = (high - low) / (self.bins - 1) if high > low else max(abs(low), 1.0) * 1e-6
+            self.low = low - self.width / 2 if high == low else low
+        while values.min() < self.low:
+            self._grow(up=False)
+        while values.max() >= self.low + self.bins * self.width:
+            self._grow(up=True)
+        positions = ((values - self.low) // self.width).astype(int)
+        self.counts += np.bincount(np.clip(positions, 0, self.bins - 1), minlength=self.bins)
+
+    @property
+    def edges(self):
+        return self.low + self.width * np.arange(self.bins + 1)
+
+    def percentiles(self, q):
+        total = self.counts.sum()
+        if not total:
+            return np.full(len(q), np.nan)
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)]) / total
+        return np.interp(np.asarray(q) / 100, cumulative, self.edges)
+
+
+# running mean, standard deviation and histogram of the scores of every category
+class ScoreSummary:
+    def __init__(self, methods, bins=64):
+        self.methods = list(methods)
+        self.count = 0
+        self.mean = np.zeros(len(self.methods))
+        self.m2 = np.zeros(len(self.methods))
+        self.histograms = [StreamingHistogram(bins) for _ in self.methods]
+
+    # (iterations x methods) scores of a chunk, merged with the parallel form of Welford's algorithm
+    def add(self, scores):
+        scores = np.asarray(scores, dtype=float)
+        n = len(scores)
+        if not n:
+            return
+        mean = scores.mean(axis=0)
+        m2 = ((scores - mean) ** 2).sum(axis=0)
+        delta = mean - self.mean
+        total = self.count + n
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        for histogram, column in zip(self.histograms, scores.T):
+            histogram.add(column)
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.zeros(len(self.methods))
+
+    def percentiles(self, q=PERCENTILES):
+        return np.array([histogram.percentiles(q) for histogram in self.histograms])
+
+
+# LCA of the worker process with its method stack, built for the first chunk of a run and redrawn by the next ones:
+# (key, lca, method_stack)
+_worker = {'lca': None}
+
+
+def _worker_lca(setup_df, methods, relative_std):
+    import bw2data as bd
+    import bw2calc as bc
+
+    from cache import setup_key
+    from foreground import FOREGROUND_ID, foreground_datapackage, foreground_exchanges, resolve_nodes
+    from lcia import MethodStack
+
+    key = (setup_key(setup_df.to_dict('records'), {}, methods), relative_std)
+    if _worker['lca'] is not None and _worker['lca'][0] == key:
+        return _worker['lca'][1:]
+    _worker['lca'] = None
+    exchanges = foreground_exchanges(setup_df)
+    nodes = resolve_nodes(exchanges['Activity'])
+    activity_ids = [nodes[code]['id'] for code in exchanges['Activity']]
+    demand = {bd.get_node(id=act_id): 1 for act_id in set(activity_ids)}
+    _, data_objs, _ = bd.prepare_lca_inputs(demand=demand, method=methods[0], remapping=False)
+    lca = bc.LCA(
+        {FOREGROUND_ID: 1},
+        data_objs=data_objs + [foreground_datapackage(exchanges, activity_ids, relative_std)],
+        use_distributions=True,
+    )
+    lca.lci()
+    _worker['lca'] = (key, lca, MethodStack(lca, methods))
+    return _worker['lca'][1:]
+
+
+# every random draw of the LCA (distributions of the resource groups, indexers of the array datapackages) starts
+# again from seed, so that the samples of a chunk do not depend on the chunks the worker ran before
+def _reseed(lca, seed):
+    from matrix_utils.indexers import RandomIndexer
+    from stats_arrays import MCRandomNumberGenerator
+
+    for matrix in (lca.technosphere_mm, lca.biosphere_mm):
+        for package in matrix.packages:
+            if isinstance(getattr(package, 'indexer', None), RandomIndexer):
+                package.indexer.seed = seed
+                package.indexer.reset()
+        for group in matrix.groups:
+            if isinstance(getattr(group, 'rng', None), MCRandomNumberGenerator):
+                group.rng.random.seed(seed)
+
+
+# scores of the iterations of one chunk, with its own seed: a chunk gives the same samples on any worker
+def run_chunk(setup_df, methods, iterations, seed, relative_std=None):
+    lca, method_stack = _worker_lca(setup_df, methods, relative_std)
+    _reseed(lca, seed)
+    scores = np.zeros((iterations, len(methods)))
+    for i in range(iterations):
+        next(lca)
+        scores[i] = method_stack.scores(lca)
+    return scores
+
+
+# iterations split in chunks computed by a pool of processes; yields the summary each time chunks are merged.
+# The seeds of the chunks are derived from seed, and the chunks are merged in their order (a chunk that completes
+# early waits for the ones before it), so that a run can be reproduced whatever the number of workers: the range of
+# the histograms depends on the order of the samples
+def monte_carlo(setup_df, methods, iterations=1000, relative_std=None, seed=None, workers=None, chunk_size=50,
+                initializer=None, initargs=()):
+    sizes = [chunk_size] * (iterations // chunk_size) + ([iterations % chunk_size] if iterations % chunk_size else [])
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(len(sizes))]
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+
+    summary = ScoreSummary(methods)
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=initializer, initargs=initargs) as executor:
+        futures = [
+            executor.submit(run_chunk, setup_df, methods, size, chunk_seed, relative_std)
+            for size, chunk_seed in zip(sizes, seeds)
+        ]
+        pending = set(futures)
+        merged = 0
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                start = merged
+                while merged < len(futures) and futures[merged].done():
+                    summary.add(futures[merged].result())
+                    merged += 1
+                if merged > start:
+                    yield summary
+        finally:
+            for future in pending:
+                future.cancel()
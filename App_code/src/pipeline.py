@@ -0,0 +1,377 @@
+# the Aspen-to-LCA computation without the GUI: stream tables -> mapped lca setup -> impacts of every category.
+# The callbacks of app.py and the batch runs (batch.py) go through the same functions
+import io
+import os
+
+import pandas as pd
+
+import backend
+from aspen_io import read_material_table, read_utility_table
+from cache import setup_key
+from catalog import method_unit
+from metrics import phase
+from templates import mapping_from_template, read_template
+from units import convert_flows, flow_amounts, flow_column
+
+# columns of the lca setup passed to the computation
+SETUP_COLUMNS = ['Stream Name', 'Type', 'Activity', 'Act unit', 'Amount']
+
+# columns of a mapping file: stream name, flow type (as in the app) and code of the activity or flow
+MAPPING_COLUMNS = ['Stream Name', 'Type', 'Activity']
+
+# columns of the utility streams
+UTILITY_COLUMNS = ['Stream Name', 'Ultimate fuel source', 'Mass Flows', 'Duty', 'Type']
+
+# columns of the mapping grid of the app: one row per stream, Stream being its kind (Input, Output or Utility)
+GRID_COLUMNS = ['Stream Name', 'Stream', 'Mass Flows', 'Type', 'Activity', 'Activity name']
+
+# types a stream of each kind can take
+STREAM_TYPES = {
+    'Input': ['Technosphere', 'Biosphere', 'No impact'],
+    'Output': ['Reference flow', 'Waste flow', 'By-product', 'Biosphere flow'],
+    'Utility': ['Utility'],
+}
+
+# types mapped to an ecoinvent activity, and to an elementary flow
+TECHNOSPHERE_TYPES = ('Technosphere', 'Waste flow', 'Utility')
+BIOSPHERE_TYPES = ('Biosphere', 'Biosphere flow')
+
+# version of the layout of the results kept in the result cache (see results_key)
+RESULTS_VERSION = 2
+
+
+# input streams (no From block) and output streams (no To block) of the material table, in base units
+def material_streams(material):
+    material_df = convert_flows(material.flows, material.units)
+    outputs = (material_df['From'].notna()) & (material_df['To'].isna())
+    inputs = (material_df['From'].isna()) & (material_df['To'].notna())
+    columns = ['Mass Flows', 'Volume Flow', 'Mole Flows']
+    return material_df.loc[inputs, columns].reset_index(), material_df.loc[outputs, columns].reset_index()
+
+
+# utilities of the utility table, in base units
+def utility_streams(utility):
+    utility_df = convert_flows(utility.flows, utility.units)
+    util_df = utility_df[['Ultimate fuel source', 'Mass flow', 'Duty']].rename(columns={'Mass flow': 'Mass Flows'}).reset_index()
+    util_df['Type'] = 'Utility'
+    return util_df[UTILITY_COLUMNS]
+
+
+# input, output and utility streams of Aspen export files (the utility table is optional)
+def read_streams(materials_path, utilities_path=None):
+    with open(materials_path, 'rb') as f:
+        in_df, out_df = material_streams(read_material_table(f.read(), os.path.basename(materials_path)))
+    if utilities_path is None:
+        return in_df, out_df, pd.DataFrame(columns=UTILITY_COLUMNS)
+    with open(utilities_path, 'rb') as f:
+        util_df = utility_streams(read_utility_table(f.read(), os.path.basename(utilities_path)))
+    return in_df, out_df, util_df
+
+
+# mapping file (.csv, .xlsx, .parquet) or mapping template (.json, see templates.py). The Act unit of the templates
+# is kept (see changed_units)
+def read_mapping(path):
+    name = path.lower()
+    if name.endswith('.json'):
+        mapping = mapping_from_template(read_template(path))
+    elif name.endswith(('.xlsx', '.xlsm')):
+        mapping = pd.read_excel(path)
+    elif name.endswith('.parquet'):
+        mapping = pd.read_parquet(path)
+    else:
+        mapping = pd.read_csv(path, sep=None, engine='python')
+    missing = [column for column in MAPPING_COLUMNS if column not in mapping.columns]
+    if missing:
+        raise ValueError(f"Column(s) not found in {path}: {', '.join(missing)}")
+    columns = MAPPING_COLUMNS + (['Act unit'] if 'Act unit' in mapping.columns else [])
+    return mapping[columns].astype(object).map(lambda value: None if pd.isna(value) else value)
+
+
+# Type and Activity of the streams from a mapping (one row per stream name).
+# Utilities keep their type; inputs that are not mapped have no impact
+def apply_mapping(in_df, out_df, util_df, mapping):
+    mapping = mapping.drop_duplicates('Stream Name', keep='last').set_index('Stream Name')
+    in_df, out_df, util_df = in_df.copy(), out_df.copy(), util_df.copy()
+    for df in (in_df, out_df, util_df):
+        df['Activity'] = pd.Series([mapping['Activity'].get(name) for name in df['Stream Name']], index=df.index,
+                                   dtype=object)
+    in_df['Type'] = [mapping['Type'].get(name) or 'No impact' for name in in_df['Stream Name']]
+    out_df['Type'] = [mapping['Type'].get(name) for name in out_df['Stream Name']]
+    return in_df, out_df, util_df
+
+
+def _units(df, nodes):
+    return df['Activity'].map(lambda code: nodes[code]['unit'] if code in nodes else None).astype(object)
+
+
+# mapping of the streams with the unit of their activity, as saved in the templates
+def stream_mapping(in_df, out_df, util_df, nodes):
+    mapping = pd.concat([df[MAPPING_COLUMNS] for df in (in_df, out_df, util_df) if len(df)]).reset_index(drop=True)
+    mapping['Act unit'] = _units(mapping, nodes)
+    return mapping
+
+
+# streams of a mapping whose activity no longer has the unit saved with the mapping (Act unit of the templates):
+# their flow would be converted to another unit than the one the mapping was made for
+def changed_units(mapping, nodes):
+    if 'Act unit' not in mapping.columns:
+        return []
+    return [name for name, code, unit in zip(mapping['Stream Name'], mapping['Activity'], mapping['Act unit'])
+            if code in nodes and not pd.isna(unit) and unit != nodes[code]['unit']]
+
+
+# database searched for the activity of a stream type: 'technosphere', 'biosphere' or None (no activity)
+def activity_kind(stream_type):
+    if stream_type in TECHNOSPHERE_TYPES:
+        return 'technosphere'
+    if stream_type in BIOSPHERE_TYPES:
+        return 'biosphere'
+    return None
+
+
+# name shown for a node: activities with their location, elementary flows with their categories
+def node_label(node):
+    if node is None:
+        return None
+    detail = node.get('location') or '/'.join(node.get('categories') or ())
+    return f"{node['name']}, {detail}" if detail else node['name']
+
+
+# mapping grid of the uploaded streams, with the type and activity of the streams found in mapping
+# (columns of MAPPING_COLUMNS, and the Act unit of the templates). nodes are the metadata of the activity codes; codes
+# that are not in nodes are left out, as are the activities of changed_units
+def mapping_grid(in_df, out_df, util_df, mapping=None, nodes=None):
+    nodes = nodes or {}
+    frames = [
+        pd.DataFrame({'Stream Name': df['Stream Name'], 'Stream': kind, 'Mass Flows': df['Mass Flows']})
+        for kind, df in (('Input', in_df), ('Output', out_df), ('Utility', util_df)) if len(df)
+    ]
+    if not frames:
+        return pd.DataFrame(columns=GRID_COLUMNS)
+    grid = pd.concat(frames).reset_index(drop=True).astype({'Stream Name': object, 'Stream': object})
+    grid['Type'] = pd.Series([kind if kind == 'Utility' else None for kind in grid['Stream']], dtype=object)
+    grid['Activity'] = pd.Series([None] * len(grid), dtype=object)
+    if mapping is not None and len(mapping):
+        mapping = mapping.drop_duplicates('Stream Name', keep='last')
+        changed = set(changed_units(mapping, nodes))
+        mapping = mapping.set_index('Stream Name')
+        for i, (name, kind) in enumerate(zip(grid['Stream Name'], grid['Stream'])):
+            if name not in mapping.index:
+                continue
+            stream_type = grid.at[i, 'Type'] if kind == 'Utility' else mapping.at[name, 'Type']
+            if stream_type not in STREAM_TYPES[kind]:
+                continue
+            grid.at[i, 'Type'] = stream_type
+            code = mapping.at[name, 'Activity']
+            if activity_kind(stream_type) is not None and code in nodes and name not in changed:
+                grid.at[i, 'Activity'] = code
+    grid['Activity name'] = pd.Series([node_label(nodes.get(code)) if code else None for code in grid['Activity']], dtype=object)
+    return grid[GRID_COLUMNS]
+
+
+# new type of a stream of the grid: its activity is kept only if it is searched in the same database
+def set_stream_type(grid, row, stream_type):
+    if activity_kind(stream_type) != activity_kind(grid.at[row, 'Type']):
+        grid.at[row, 'Activity'] = None
+        grid.at[row, 'Activity name'] = None
+    grid.at[row, 'Type'] = stream_type
+    return grid
+
+
+# whether the grid can be computed (every stream typed, mapped if its type needs an activity, and a reference flow),
+# with a message for the user. Utilities without activity have no impact
+def mapping_status(grid):
+    if grid.empty:
+        return False, ''
+    needs_activity = grid['Type'].isin(('Technosphere', 'Waste flow') + BIOSPHERE_TYPES)
+    missing = int(grid['Type'].isna().sum() + (needs_activity & grid['Activity'].isna()).sum())
+    if missing:
+        return False, f' {missing} stream(s) to map'
+    if 'Reference flow' not in set(grid['Type']):
+        return False, ' One of the output must be the reference flow'
+    unmapped = int(((grid['Stream'] == 'Utility') & grid['Activity'].isna()).sum())
+    return True, f' {unmapped} utilities without activity (no impact)' if unmapped else ' Mapping complete'
+
+
+# lca setup from the streams with their Type and Activity: unit of each activity and amount per unit of reference flow.
+# nodes are the metadata of the activity codes (see Catalog.resolve). Biosphere inputs and emissions are not computed
+def lca_setup(in_df, out_df, util_df, nodes):
+    if 'Reference flow' not in set(out_df['Type']):
+        raise ValueError('One of the output streams must be the reference flow')
+    in_df, out_df, util_df = in_df.copy(), out_df.copy(), util_df.copy()
+
+    in_df['Act unit'] = _units(in_df, nodes)
+    in_df.loc[in_df['Type'] == 'No impact', 'Act unit'] = None
+
+    # waste treatments with a negative production amount take the waste as a negative input
+    out_df['Act unit'] = 'kilogram'
+    waste = out_df['Type'] == 'Waste flow'
+    out_df.loc[waste, 'Act unit'] = _units(out_df[waste], nodes)
+    negative = waste & out_df['Activity'].map(lambda code: code in nodes and (nodes[code]['production amount'] or 0) < 0)
+    for column in ('Mass Flows', 'Volume Flow', 'Mole Flows'):
+        if column in out_df:
+            out_df.loc[negative, column] *= -1
+
+    util_df['Act unit'] = _units(util_df, nodes)
+
+    reference_mass_flow = out_df.loc[out_df['Type'] == 'Reference flow', 'Mass Flows'].iloc[0]
+
+    out_df['Amount'] = flow_amounts(out_df, reference_mass_flow)
+    in_df['Amount'] = flow_amounts(in_df, reference_mass_flow)
+    util_df['Amount'] = flow_amounts(util_df, reference_mass_flow)
+
+    act_df = pd.concat([in_df, out_df])
+    act_df.loc[act_df['Type'] == 'Reference flow', 'Activity'] = act_df.loc[act_df['Type'] == 'Reference flow', 'Stream Name']
+    act_df = act_df[~act_df['Type'].str.contains('Biosphere', na=False)]
+
+    return pd.concat([act_df, util_df])[SETUP_COLUMNS].reset_index(drop=True)
+
+
+# table of sweep cases: one row per case (first column: name of the case) and one column per stream,
+# with the flow of the stream in the base unit of the column used by its activity (kg/hr, m3/hr, MJ/hr, kmol/hr)
+def read_sweep_table(content, filename):
+    name = filename.lower()
+    if name.endswith(('.xlsx', '.xlsm')):
+        cases = pd.read_excel(io.BytesIO(content), index_col=0)
+    elif name.endswith('.parquet'):
+        cases = pd.read_parquet(io.BytesIO(content))
+        cases = cases.set_index(cases.columns[0])
+    else:
+        cases = pd.read_csv(io.BytesIO(content), sep=None, engine='python', index_col=0)
+    cases.index = cases.index.astype(str)
+    cases.columns = cases.columns.astype(str).str.strip()
+    return cases.apply(pd.to_numeric, errors='coerce')
+
+
+# streams of one case: the flows given for the case replace the ones of the upload, in the column of the unit
+# of the activity of each stream (streams without activity, like the reference flow, are mass flows)
+def case_streams(in_df, out_df, util_df, nodes, flows):
+    frames = []
+    for df in (in_df, out_df, util_df):
+        df = df.copy()
+        for i, (name, code) in enumerate(zip(df['Stream Name'], df['Activity'])):
+            if name in flows and not pd.isna(flows[name]):
+                column = flow_column(nodes[code]['unit']) if code in nodes else 'Mass Flows'
+                if column is not None:
+                    df.loc[df.index[i], column] = flows[name]
+        frames.append(df)
+    return frames
+
+
+# lca setup of every case of a sweep table, from the mapped streams
+def sweep_setups(in_df, out_df, util_df, nodes, cases):
+    return [lca_setup(*case_streams(in_df, out_df, util_df, nodes, flows), nodes) for _, flows in cases.iterrows()]
+
+
+# total impacts (cases x EF categories) of a sweep: all the cases are solved together (see sweep_lca)
+def sweep_results(setups, case_names):
+    EF_select = backend.methods()
+    ei_db = backend.ecoinvent()
+    lca_pool = backend.lca_pool()
+    records = [dict(record, Case=name) for name, setup_df in zip(case_names, setups) for record in setup_df.to_dict('records')]
+    key = setup_key(records, backend.database_versions(), EF_select)
+    result_cache = backend.result_cache()
+    results = result_cache.get(key)
+    if results is None:
+        from foreground import sweep_lca
+
+        scores = sweep_lca(
+            setups, EF_select,
+            background=lca_pool.get(ei_db.name, EF_select),
+            unit_impacts=lca_pool.unit_impacts(ei_db.name, EF_select),
+            resolve=backend.catalog().resolve,
+        )
+        results = pd.DataFrame(scores, index=pd.Index(case_names, name='Case'), columns=[met[1] for met in EF_select])
+        result_cache.put(key, results)
+    return results
+
+
+# key of the results of a setup in the result cache (also names the export files of the results). Results cached by
+# earlier versions (which also held the contributions) have another key and are computed again
+def results_key(lca_setting_df):
+    return f'v{RESULTS_VERSION}-' + setup_key(lca_setting_df.to_dict('records'), backend.database_versions(),
+                                              backend.methods())
+
+
+# impacts of all the streams for all the EF categories, computed once per setup and then served from the cache.
+# The streams are looked up in the unit-impact table once the warm-up has built it, and solved otherwise.
+# progress(stage, done, total) reports the stages of the computation (see process_lca).
+# Returns the long table (stream x category) and the total of each category; with compute=False, None when they are
+# not in the cache yet
+def stream_results(lca_setting_df, progress=None, compute=True):
+    EF_select = backend.methods()
+    ei_db = backend.ecoinvent()
+    lca_pool = backend.lca_pool()
+    key = results_key(lca_setting_df)
+    result_cache = backend.result_cache()
+    results = result_cache.get(key)
+    if results is None and compute:
+        from foreground import process_lca
+
+        background = lca_pool.get(ei_db.name, EF_select)
+        if progress is not None:
+            progress('matrices loaded', 1, 1)
+
+        # single solve of the Aspen process as a foreground activity, with the contribution of each stream
+        exchanges, contributions, total = process_lca(
+            lca_setting_df, EF_select,
+            background=background,
+            unit_impacts=lca_pool.unit_impacts(ei_db.name, EF_select),
+            resolve=backend.catalog().resolve,
+            progress=progress,
+        )
+
+        LCIA_df_list = []
+        for i in range(len(EF_select)):
+            lca_df = exchanges.copy()
+            lca_df['Impact category'] = EF_select[i][1]
+            lca_df['Impact unit'] = method_unit(EF_select[i])
+            lca_df['Impact'] = contributions[:, i]
+            LCIA_df_list.append(lca_df)
+
+        lca_df = pd.concat(LCIA_df_list)
+        lca_df.reset_index(inplace=True, drop=True)
+
+        results = (lca_df, total)
+        result_cache.put(key, results)
+    return results
+
+
+# top upstream processes, elementary flows and regions of each category (see contribution.py), from the supply of a
+# solve of the process: computed once per setup when they are asked for, then served from the cache.
+# With compute=False, None when they are not in the cache yet
+def contribution_results(lca_setting_df, progress=None, compute=True):
+    EF_select = backend.methods()
+    ei_db = backend.ecoinvent()
+    lca_pool = backend.lca_pool()
+    key = f'{results_key(lca_setting_df)}-contributions'
+    result_cache = backend.result_cache()
+    contribution_df = result_cache.get(key)
+    if contribution_df is None and compute:
+        from contribution import CONTRIBUTION_COLUMNS, top_contributions
+        from foreground import process_lca
+
+        background = lca_pool.get(ei_db.name, EF_select)
+        if progress is not None:
+            progress('matrices loaded', 1, 1)
+        _, _, _, upstream = process_lca(
+            lca_setting_df, EF_select,
+            background=background,
+            resolve=backend.catalog().resolve,
+            progress=progress,
+            upstream=True,
+        )
+        if upstream is None:
+            contribution_df = pd.DataFrame(columns=CONTRIBUTION_COLUMNS)
+        else:
+            with phase('contribution analysis'):
+                contribution_df = top_contributions(upstream, EF_select, backend.catalog().resolve_ids)
+        result_cache.put(key, contribution_df)
+    return contribution_df
+
+
+# impacts of all the streams, total of each category and top contributions (see stream_results and
+# contribution_results), for the exports and the batch runs
+def lca_results(lca_setting_df, progress=None):
+    lca_df, total = stream_results(lca_setting_df, progress)
+    return lca_df, total, contribution_results(lca_setting_df)
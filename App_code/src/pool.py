@@ -0,0 +1,344 @@
+# long-lived background LCA models with the technosphere kept factorized, shared by all the callbacks
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+import bw2data as bd
+import bw2calc as bc
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from foreground import matrix_node_ids
+from metrics import increment, phase
+from lcia import MethodStack
+from unit_impacts import UnitImpactTable
+
+# storage format of the saved matrices, the one used by the computations so that loading needs no conversion
+MATRIX_FORMATS = {
+    'characterization': 'csr',
+    'technosphere': 'csc',
+    'biosphere': 'csr',
+}
+
+
+# number of unit supply vectors kept by a prepared model (one vector is 8 bytes per product)
+SUPPLY_CACHE_ITEMS = 256
+
+
+# matrices, characterization stack and factorization of one background database
+class PreparedLCA:
+    def __init__(self, technosphere, biosphere, product_ids, method_stack, solver, activity_ids=None, flow_ids=None,
+                 supply_cache_items=SUPPLY_CACHE_ITEMS):
+        self.technosphere_matrix = technosphere
+        self.biosphere_matrix = biosphere
+        self.product_ids = np.asarray(product_ids)
+        self.product_index = {int(act_id): i for i, act_id in enumerate(self.product_ids)}
+        # node ids of the columns (activities) and of the rows of the biosphere matrix (elementary flows)
+        self.activity_ids = self.product_ids if activity_ids is None else np.asarray(activity_ids)
+        self.flow_ids = None if flow_ids is None else np.asarray(flow_ids)
+        self.method_stack = method_stack
+        self.solver = solver
+        self.lock = threading.Lock()
+        self._direct_impacts = None
+        self.supply_cache_items = supply_cache_items
+        self.supply_dir = None
+        self._supplies = OrderedDict()
+        self._supply_lock = threading.Lock()
+
+    def reset_locks(self):
+        self.lock = threading.Lock()
+        self._supply_lock = threading.Lock()
+
+    # load the datapackages of the database (and its dependencies), build the matrices and factorize A once
+    @classmethod
+    def build(cls, database, methods):
+        node = bd.Database(database).random()
+        with phase('datapackage load'):
+            _, data_objs, _ = bd.prepare_lca_inputs(demand={node: 1}, method=methods[0], remapping=False)
+            lca = bc.LCA({node.id: 1}, data_objs=data_objs)
+        with phase('matrix build'):
+            lca.load_lci_data()
+            method_stack = MethodStack(lca, methods)
+        with phase('factorization'):
+            solver = splu(lca.technosphere_matrix.tocsc())
+
+        return cls(
+            lca.technosphere_matrix.tocsc(),
+            lca.biosphere_matrix.tocsr(),
+            matrix_node_ids(lca.dicts.product),
+            method_stack,
+            solver,
+            activity_ids=matrix_node_ids(lca.dicts.activity),
+            flow_ids=matrix_node_ids(lca.dicts.biosphere),
+        )
+
+    def covers(self, activity_ids):
+        return all(int(act_id) in self.product_index for act_id in activity_ids)
+
+    # demand matrix with one column per exchange
+    def demand(self, activity_ids, amounts):
+        demand = np.zeros((len(self.product_ids), len(activity_ids)))
+        for j, (act_id, amount) in enumerate(zip(activity_ids, amounts)):
+            demand[self.product_index[int(act_id)], j] = amount
+        return demand
+
+    # supply for one or many demand columns, reusing the factorization
+    def solve(self, demand):
+        with self.lock:
+            return self.solver.solve(demand)
+
+    # (products x activities) supply of one unit of each activity. Only the activities that are not cached are solved:
+    # the supply of the process is linear in its demand, so when a stream changes its amount nothing is solved,
+    # and when it changes its activity only that activity is. With a supply_dir the solved vectors are also saved
+    # there, for the other processes of the server (LCA jobs run in their own process).
+    # Returns the supply and the number of solved activities
+    def unit_supply(self, activity_ids):
+        activity_ids = [int(act_id) for act_id in activity_ids]
+        with self._supply_lock:
+            columns = {act_id: self._supplies[act_id] for act_id in set(activity_ids) if act_id in self._supplies}
+        for act_id in set(activity_ids).difference(columns):
+            saved = self._saved_supply(act_id)
+            if saved is not None:
+                columns[act_id] = saved
+        missing = sorted(set(activity_ids).difference(columns))
+        increment('cache_requests_total', len(columns), cache='supplies', result='hit')
+        increment('cache_requests_total', len(missing), cache='supplies', result='miss')
+        if missing:
+            with phase('solve'):
+                solved = self.solve(self.demand(missing, np.ones(len(missing))))
+            for j, act_id in enumerate(missing):
+                columns[act_id] = np.ascontiguousarray(solved[:, j])
+                self._save_supply(act_id, columns[act_id])
+        with self._supply_lock:
+            for act_id in set(activity_ids):
+                self._supplies[act_id] = columns[act_id]
+                self._supplies.move_to_end(act_id)
+            while len(self._supplies) > self.supply_cache_items:
+                self._supplies.popitem(last=False)
+        return np.column_stack([columns[act_id] for act_id in activity_ids]), len(missing)
+
+    def _saved_supply(self, act_id):
+        if self.supply_dir is None:
+            return None
+        try:
+            return np.load(os.path.join(self.supply_dir, f'{act_id}.npy'), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def _save_supply(self, act_id, supply):
+        if self.supply_dir is None:
+            return
+        os.makedirs(self.supply_dir, exist_ok=True)
+        tmp_path = os.path.join(self.supply_dir, f'{act_id}.{os.getpid()}.tmp.npy')
+        np.save(tmp_path, supply)
+        os.replace(tmp_path, os.path.join(self.supply_dir, f'{act_id}.npy'))
+
+    # (methods x columns) scores of the demand columns
+    def scores(self, demand):
+        return self.method_stack.characterize(self.biosphere_matrix @ self.solve(demand))
+
+    # sparse (methods x activities) scores of the direct emissions of one unit of each activity, computed once
+    @property
+    def direct_impacts(self):
+        if self._direct_impacts is None:
+            self._direct_impacts = sparse.csr_matrix(self.method_stack.matrix @ self.biosphere_matrix)
+        return self._direct_impacts
+
+    # one .npy file per array, in a folder written at once. When another process has saved the same model in the
+    # meantime (the folder exists), its copy is kept
+    def save(self, path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        arrays = {
+            'product_ids': self.product_ids,
+            'activity_ids': self.activity_ids,
+            'flow_ids': self.flow_ids,
+        }
+        for name, matrix in (
+            ('characterization', self.method_stack.matrix),
+            ('technosphere', self.technosphere_matrix),
+            ('biosphere', self.biosphere_matrix),
+        ):
+            arrays.update(_sparse_parts(name, matrix))
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.exists(path):
+                raise
+
+    # the matrices are memory-mapped: the processes of the server that load the same folder share one copy of them
+    # in the page cache, without reading them in. The technosphere is factorized again in each process (SuperLU
+    # keeps its factors in its own memory, and solves much faster than triangular solves on saved factors)
+    @classmethod
+    def load(cls, path, methods):
+        def array(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+
+        matrices = {name: _sparse_from_parts(array, name) for name in MATRIX_FORMATS}
+        with phase('factorization'):
+            solver = splu(matrices['technosphere'])
+        return cls(
+            matrices['technosphere'],
+            matrices['biosphere'],
+            array('product_ids'),
+            MethodStack.from_matrix(methods, matrices['characterization']),
+            solver,
+            activity_ids=array('activity_ids'),
+            flow_ids=array('flow_ids'),
+        )
+
+
+
+def _sparse_parts(name, matrix):
+    matrix = sparse.csr_matrix(matrix) if MATRIX_FORMATS[name] == 'csr' else sparse.csc_matrix(matrix)
+    matrix.sum_duplicates()
+    return {
+        f'{name}-data': matrix.data,
+        f'{name}-indices': matrix.indices,
+        f'{name}-indptr': matrix.indptr,
+        f'{name}-shape': np.array(matrix.shape),
+    }
+
+
+def _sparse_from_parts(array, name):
+    matrix_class = sparse.csr_matrix if MATRIX_FORMATS[name] == 'csr' else sparse.csc_matrix
+    return matrix_class(
+        (array(f'{name}-data'), array(f'{name}-indices'), array(f'{name}-indptr')),
+        shape=tuple(array(f'{name}-shape')),
+        copy=False,
+    )
+
+
+# lock shared by the processes of the server, so that only one of them builds and saves a model.
+# On Windows the first byte of the lock file is locked (msvcrt gives up after 10 seconds, so it is tried again)
+@contextmanager
+def _file_lock(path):
+    with open(path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# one prepared model per (project, database, methods), created once and shared by concurrent callbacks.
+# With a directory, the matrices and the factorization are saved once and memory-mapped by every process of the
+# server (workers, jobs), so that a restarted server skips the cold start
+class LCAPool:
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._prepared = {}
+        self._tables = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    # a model still being built when the locks are reset is built again by the next caller
+    def reset_locks(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+        for prepared in self._prepared.values():
+            prepared.reset_locks()
+
+    def _digest(self, project, database, methods):
+        version = {
+            'project': project,
+            'database': database,
+            'modified': bd.databases[database].get('modified'),
+            'methods': [list(method) for method in methods],
+        }
+        return hashlib.sha256(json.dumps(version, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:24]
+
+    def _path(self, project, database, methods):
+        return os.path.join(self.directory, f'lca-{self._digest(project, database, methods)}')
+
+    def get(self, database, methods):
+        key = (bd.projects.current, database, tuple(methods))
+        with self._lock:
+            if key in self._prepared:
+                return self._prepared[key]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        # only the first caller builds the model, the others wait for it
+        with key_lock:
+            with self._lock:
+                if key in self._prepared:
+                    return self._prepared[key]
+
+            if self.directory is None:
+                prepared = PreparedLCA.build(database, methods)
+            else:
+                prepared = self._load_or_build(self._path(*key), database, methods)
+
+            with self._lock:
+                self._prepared[key] = prepared
+            return prepared
+
+    # the first process builds and saves the model and keeps the one it built, the others load the memory-mapped copy.
+    # The unit supplies solved by any of them are saved next to it
+    def _load_or_build(self, path, database, methods):
+        with _file_lock(f'{path}.lock'):
+            prepared = None
+            if os.path.exists(path):
+                try:
+                    with phase('model load'):
+                        prepared = PreparedLCA.load(path, methods)
+                except (OSError, ValueError):
+                    shutil.rmtree(path, ignore_errors=True)
+                    shutil.rmtree(f'{path}-supply', ignore_errors=True)
+            if prepared is None:
+                prepared = PreparedLCA.build(database, methods)
+                prepared.save(path)
+        prepared.supply_dir = f'{path}-supply'
+        return prepared
+
+    # unit-impact table of the database if it has been precomputed, otherwise None
+    def unit_impacts(self, database, methods):
+        return self._tables.get((bd.projects.current, database, tuple(methods)))
+
+    # precompute the unit-impact table from the prepared model (meant to run in a background thread).
+    # With a directory the table is saved once and memory-mapped afterwards
+    def build_unit_impacts(self, database, methods):
+        key = (bd.projects.current, database, tuple(methods))
+        if key in self._tables:
+            return self._tables[key]
+        prefix = os.path.join(self.directory, f'unit-impacts-{self._digest(*key)}') if self.directory is not None else None
+        if prefix is None:
+            table = UnitImpactTable.compute(self.get(database, methods))
+        else:
+            with _file_lock(f'{prefix}.lock'):
+                if not UnitImpactTable.exists(prefix):
+                    UnitImpactTable.compute(self.get(database, methods)).save(prefix)
+                table = UnitImpactTable.load(prefix)
+        with self._lock:
+            self._tables[key] = table
+        return table
@@ -0,0 +1,24 @@
+# server-side data of the sessions: the dcc.Store components in the browser only hold the key of their data
+import uuid
+
+from cache import ResultCache
+
+
+class SessionStore:
+    def __init__(self, directory=None, max_items=1024, max_bytes=512 * 2**20):
+        self._data = ResultCache(max_items=max_items, max_bytes=max_bytes, directory=directory, name='sessions')
+
+    def reset_locks(self):
+        self._data.reset_locks()
+
+    # keep the data on the server and return the key sent to the browser
+    def put(self, data):
+        key = uuid.uuid4().hex
+        self._data.put(key, data)
+        return key
+
+    # data of a key, or None if there is no key or the data has expired
+    def get(self, key):
+        if key is None:
+            return None
+        return self._data.get(key)
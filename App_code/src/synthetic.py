@@ -0,0 +1,254 @@
+# synthetic stand-ins for the benchmarks (see benchmark.py): a brightway project shaped like ecoinvent
+# (activities, elementary flows and a family of impact methods, with comparable sparsity) and Aspen Plus exports
+# of any size. Everything is drawn from a seeded generator, so the same parameters give the same models and results
+import os
+
+import numpy as np
+
+# database names and method family of the synthetic project
+ECOINVENT = 'synthetic-ecoinvent'
+BIOSPHERE = 'synthetic-biosphere'
+METHOD_FAMILY = 'Synthetic EF'
+# version of the generator: a project generated by another version is generated again
+VERSION = 1
+
+PRODUCTS = [
+    'steel', 'aluminium', 'copper', 'cement', 'clinker', 'concrete', 'glass', 'paper', 'cardboard', 'sawnwood',
+    'polyethylene', 'polypropylene', 'polystyrene', 'nylon', 'ammonia', 'nitric acid', 'sulfuric acid', 'methanol',
+    'ethylene', 'propylene', 'benzene', 'toluene', 'xylene', 'chlorine', 'sodium hydroxide', 'hydrogen', 'nitrogen',
+    'oxygen', 'natural gas', 'diesel', 'petrol', 'heavy fuel oil', 'hard coal', 'lignite', 'electricity', 'heat',
+    'steam', 'tap water', 'wastewater', 'transport, freight, lorry', 'transport, freight, train', 'limestone',
+    'sand', 'gravel', 'lime', 'fertiliser', 'wheat grain', 'maize grain', 'palm oil', 'soybean',
+]
+QUALIFIERS = [
+    'low-alloyed', 'unalloyed', 'primary', 'secondary', 'high voltage', 'medium voltage', 'low voltage', 'liquid',
+    'pressurised', 'at plant', 'for reuse', 'packed', 'unpacked', 'high density', 'low density', 'granulate',
+    'organic', 'conventional', 'bleached', 'unbleached', 'from cracking', 'from reforming', 'industrial', 'municipal',
+]
+PROCESSES = ['production', 'processing', 'treatment', 'converter', 'electrolysis', 'from recycling', 'cogeneration']
+LOCATIONS = ['GLO', 'RoW', 'RER', 'Europe without Switzerland', 'CH', 'DE', 'FR', 'IT', 'ES', 'GB', 'PL', 'NL',
+             'US', 'CA-QC', 'BR', 'CN', 'IN', 'JP', 'KR', 'ZA', 'AU', 'RU']
+# units of the activities and their share, with units the Aspen flows cannot be converted to (as in ecoinvent)
+UNITS = {'kilogram': 0.55, 'megajoule': 0.12, 'kilowatt hour': 0.08, 'cubic meter': 0.08, 'ton kilometer': 0.07,
+         'unit': 0.05, 'square meter': 0.05}
+SUBSTANCES = [
+    'Carbon dioxide, fossil', 'Carbon dioxide, non-fossil', 'Methane, fossil', 'Methane, non-fossil',
+    'Dinitrogen monoxide', 'Sulfur dioxide', 'Nitrogen oxides', 'Ammonia', 'Particulate Matter, < 2.5 um',
+    'Particulate Matter, > 10 um', 'Carbon monoxide, fossil', 'NMVOC, non-methane volatile organic compounds',
+    'Benzene', 'Formaldehyde', 'Lead', 'Mercury', 'Cadmium', 'Zinc', 'Copper', 'Nickel', 'Chromium VI', 'Arsenic',
+    'Phosphate', 'Nitrate', 'COD, Chemical Oxygen Demand', 'BOD5, Biological Oxygen Demand', 'Dioxins',
+    'Water', 'Occupation, arable land', 'Transformation, from forest', 'Gas, natural', 'Oil, crude', 'Coal, hard',
+    'Iron', 'Aluminium', 'Uranium', 'Energy, gross calorific value, in biomass', 'Radon-222', 'Tritium',
+]
+COMPARTMENTS = [
+    ('air',), ('air', 'urban air close to ground'), ('air', 'non-urban air or from high stacks'),
+    ('air', 'lower stratosphere + upper troposphere'), ('water',), ('water', 'surface water'),
+    ('water', 'ground-'), ('water', 'ocean'), ('soil',), ('soil', 'agricultural'), ('soil', 'industrial'),
+    ('natural resource', 'in ground'), ('natural resource', 'land'),
+]
+# impact categories of the method family, with the share of the elementary flows they characterize
+CATEGORIES = [
+    ('climate change', 'kg CO2-Eq', 0.03), ('ozone depletion', 'kg CFC-11-Eq', 0.01),
+    ('acidification', 'mol H+-Eq', 0.01), ('eutrophication: freshwater', 'kg P-Eq', 0.01),
+    ('eutrophication: marine', 'kg N-Eq', 0.01), ('eutrophication: terrestrial', 'mol N-Eq', 0.01),
+    ('photochemical oxidant formation', 'kg NMVOC-Eq', 0.05),
+    ('particulate matter formation', 'disease incidence', 0.01),
+    ('human toxicity: carcinogenic', 'CTUh', 0.3), ('human toxicity: non-carcinogenic', 'CTUh', 0.4),
+    ('ecotoxicity: freshwater', 'CTUe', 0.5), ('ionising radiation', 'kBq U235-Eq', 0.02),
+    ('land use', 'dimensionless', 0.05), ('water use', 'm3 world eq. deprived', 0.02),
+    ('energy resources: non-renewable', 'MJ', 0.01), ('material resources: metals/minerals', 'kg Sb-Eq', 0.03),
+]
+
+# Aspen blocks and fuels used to name the streams and utilities
+BLOCKS = ['FEED', 'MIXER', 'REACTOR', 'FLASH', 'COLUMN', 'HEATX', 'COOLER', 'SPLIT', 'DRYER', 'FURNACE', 'COMP']
+FUELS = ['NATURAL_GAS', 'ELECTRICITY', 'COAL', 'FUEL_OIL', 'STEAM']
+
+
+# parameters of the project, kept in the metadata of its databases to know whether it must be generated again
+def project_parameters(activities, flows, methods, seed):
+    return {'activities': activities, 'flows': flows, 'methods': methods, 'seed': seed, 'version': VERSION}
+
+
+def _biosphere_data(rng, flows):
+    data = {}
+    for i in range(flows):
+        substance = SUBSTANCES[i % len(SUBSTANCES)]
+        name = substance if i < len(SUBSTANCES) else f'{substance} ({i // len(SUBSTANCES)})'
+        categories = COMPARTMENTS[rng.integers(len(COMPARTMENTS))]
+        data[(BIOSPHERE, f'flow-{i:05d}')] = {
+            'name': name,
+            'categories': categories,
+            'unit': 'kilogram',
+            'type': 'natural resource' if categories[0] == 'natural resource' else 'emission',
+            'exchanges': [],
+        }
+    return data
+
+
+# activities with about 10 technosphere inputs and 25 elementary flows each, a few popular inputs and flows
+# (electricity, CO2, ...) being used by most of them. As in ecoinvent the supply chains are mostly hierarchical:
+# the inputs come from the activities before (the first ones are the basic commodities), and 5% of the activities
+# also supply one after them, which makes loops. The inputs of a column sum below one half, which keeps the
+# technosphere matrix invertible. About 2% of the activities are waste treatments (negative production)
+def _ecoinvent_data(rng, activities, flows):
+    units = list(UNITS)
+    unit_choice = rng.choice(len(units), size=activities, p=np.array(list(UNITS.values())) / sum(UNITS.values()))
+    activity_cdf = np.cumsum(1 / np.arange(1, activities + 1) ** 0.7)
+    flow_cdf = np.cumsum(1 / np.arange(1, flows + 1) ** 0.8)
+
+    # distinct indices below end drawn by weight (cumulative weights cdf)
+    def draw(cdf, size, end):
+        if not end:
+            return []
+        picks = np.minimum(np.searchsorted(cdf[:end], rng.random(3 * size + 3) * cdf[end - 1]), end - 1)
+        return list(dict.fromkeys(picks.tolist()))[:size]
+
+    data = {}
+    for i in range(activities):
+        base, qualifier = PRODUCTS[rng.integers(len(PRODUCTS))], QUALIFIERS[rng.integers(len(QUALIFIERS))]
+        product = f'{base}, {qualifier}'
+        waste = rng.random() < 0.02
+        if waste:
+            name, product = f'treatment of waste {product}', f'waste {product}'
+        elif rng.random() < 0.3:
+            name = f'market for {product}'
+        else:
+            name = f'{base} {PROCESSES[rng.integers(len(PROCESSES))]}, {qualifier}'
+        code = f'act-{i:05d}'
+        production = -1.0 if waste else 1.0
+
+        inputs = draw(activity_cdf, 1 + rng.poisson(9), i)
+        if rng.random() < 0.05 and i < activities - 1:
+            inputs.append(int(rng.integers(i + 1, activities)))
+        amounts = rng.dirichlet(np.ones(len(inputs))) * rng.uniform(0.05, 0.45) if inputs else []
+        emitted = draw(flow_cdf, 1 + rng.poisson(24), flows)
+
+        exchanges = [{'input': (ECOINVENT, code), 'amount': production, 'type': 'production'}]
+        exchanges += [
+            {'input': (ECOINVENT, f'act-{j:05d}'), 'amount': float(amount), 'type': 'technosphere'}
+            for j, amount in zip(inputs, amounts)
+        ]
+        exchanges += [
+            {'input': (BIOSPHERE, f'flow-{k:05d}'), 'amount': float(amount), 'type': 'biosphere'}
+            for k, amount in zip(emitted, rng.lognormal(-4, 2.5, size=len(emitted)))
+        ]
+        data[(ECOINVENT, code)] = {
+            'name': name,
+            'reference product': product,
+            'location': LOCATIONS[rng.integers(len(LOCATIONS))],
+            'unit': units[unit_choice[i]],
+            'production amount': production,
+            'exchanges': exchanges,
+        }
+    return data
+
+
+# characterization factors of each category on its share of the elementary flows (always some of the popular ones)
+def _method_data(rng, methods, flows):
+    result = []
+    for m in range(methods):
+        category, unit, share = CATEGORIES[m % len(CATEGORIES)]
+        if m >= len(CATEGORIES):
+            category = f'{category} ({m // len(CATEGORIES)})'
+        size = max(1, min(flows, int(share * flows)))
+        characterized = np.union1d(rng.choice(flows, size=size, replace=False), np.arange(min(5, flows)))
+        factors = rng.lognormal(0, 2, size=len(characterized))
+        cfs = [((BIOSPHERE, f'flow-{k:05d}'), float(cf)) for k, cf in zip(characterized, factors)]
+        result.append(((METHOD_FAMILY, category, 'synthetic'), unit, cfs))
+    return result
+
+
+# synthetic project (databases ECOINVENT and BIOSPHERE, methods of METHOD_FAMILY) in the brightway project name,
+# generated only when it does not exist yet with the same parameters. Returns whether it was generated
+def ensure_project(name, activities=20000, flows=4000, methods=16, seed=0):
+    import bw2data as bd
+
+    bd.projects.set_current(name)
+    parameters = project_parameters(activities, flows, methods, seed)
+    if ECOINVENT in bd.databases and bd.databases[ECOINVENT].get('synthetic') == parameters:
+        return False
+
+    for database in (ECOINVENT, BIOSPHERE):
+        if database in bd.databases:
+            del bd.databases[database]
+    for method in [method for method in bd.methods if method[0] == METHOD_FAMILY]:
+        bd.Method(method).deregister()
+
+    rng = np.random.default_rng(seed)
+    bd.Database(BIOSPHERE).write(_biosphere_data(rng, flows))
+    bd.Database(ECOINVENT).write(_ecoinvent_data(rng, activities, flows))
+    for method, unit, cfs in _method_data(rng, methods, flows):
+        bd.Method(method).register(unit=unit)
+        bd.Method(method).write(cfs)
+
+    bd.databases[ECOINVENT]['synthetic'] = parameters
+    bd.databases.flush()
+    return True
+
+
+def _material_rows(rng, streams, components):
+    n_inputs = max(1, int(0.3 * streams))
+    n_outputs = max(1, int(0.2 * streams))
+    names = [f'S{i + 1:04d}' for i in range(streams)]
+    blocks = [f'{BLOCKS[i % len(BLOCKS)]}{i // len(BLOCKS) + 1}' for i in range(max(4, streams // 3))]
+    source = [None if i < n_inputs else blocks[rng.integers(len(blocks))] for i in range(streams)]
+    target = [None if n_inputs <= i < n_inputs + n_outputs else blocks[rng.integers(len(blocks))]
+              for i in range(streams)]
+
+    fractions = rng.dirichlet(np.full(components, 0.3), size=streams).T
+    mass = rng.lognormal(3, 2, size=streams)
+    molar_mass = rng.uniform(2, 300, size=components)
+    component_names = [f'COMP{j + 1:03d}' for j in range(components)]
+
+    rows = [[], [], [None, None, 'Material'], [None, None, 'Stream Name', 'Units'] + names,
+            [None, None, 'Description'], [None, None, 'From', None] + source, [None, None, 'To', None] + target,
+            [None, None, 'Stream Class', None] + ['CONVEN'] * streams, [None, None, 'Total Stream'],
+            [None, None, 'Temperature', 'C'] + list(rng.uniform(10, 600, size=streams)),
+            [None, None, 'Pressure', 'bar'] + list(rng.uniform(1, 50, size=streams)),
+            [None, None, 'Mass Flows', 'kg/hr'] + list(mass)]
+    rows += [[None, None, component, 'kg/hr'] + list(mass * f) for component, f in zip(component_names, fractions)]
+    rows += [[None, None, 'Mass Fractions']]
+    rows += [[None, None, component, None] + list(f) for component, f in zip(component_names, fractions)]
+    rows += [[None, None, 'Volume Flow', 'l/min'] + list(mass * rng.uniform(0.1, 50, size=streams))]
+    moles = (mass * fractions) / molar_mass[:, None]
+    rows += [[None, None, 'Mole Flows', 'kmol/hr'] + list(moles.sum(axis=0))]
+    rows += [[None, None, component, 'kmol/hr'] + list(m) for component, m in zip(component_names, moles)]
+    return rows
+
+
+def _utility_rows(rng, utilities):
+    names = [f'U-{i + 1}' for i in range(utilities)]
+    fuels = [FUELS[rng.integers(len(FUELS))] for _ in range(utilities)]
+    electric = [fuel == 'ELECTRICITY' for fuel in fuels]
+    mass = [None if e else float(m) for e, m in zip(electric, rng.lognormal(5, 1.5, size=utilities))]
+    return [
+        ['Utility ID', None] + names,
+        ['Utility type', None] + ['ELECTRICITY' if e else 'GENERAL' for e in electric],
+        ['Costing rate', '$/hr'] + list(rng.uniform(0.01, 10, size=utilities)),
+        ['Mass flow', 'kg/hr'] + mass,
+        ['Duty', 'MJ/hr'] + list(rng.lognormal(4, 2, size=utilities)),
+        ['Ultimate fuel source', None] + fuels,
+    ]
+
+
+def _write_sheet(path, title, rows):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    for row in rows:
+        sheet.append([float(value) if isinstance(value, np.floating) else value for value in row])
+    workbook.save(path)
+
+
+# material and utility tables laid out like the Aspen Plus exports, with streams material streams (30% process inputs,
+# 20% outputs, the others between blocks) of components components, and utilities utilities.
+# Returns the paths of the material and utility files
+def aspen_exports(directory, streams=200, utilities=20, components=40, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    materials = os.path.join(directory, f'Materials synthetic {streams}.xlsx')
+    utility = os.path.join(directory, f'Utilities synthetic {utilities}.xlsx')
+    _write_sheet(materials, 'Material', _material_rows(rng, streams, components))
+    _write_sheet(utility, 'Sheet1', _utility_rows(rng, utilities))
+    return materials, utility
@@ -0,0 +1,66 @@
+# mapping templates: the type, activity and unit of each Aspen stream, saved once and applied to new uploads
+import json
+import os
+import re
+
+import pandas as pd
+
+# fields of a stream in a template
+TEMPLATE_FIELDS = ['Stream Name', 'Type', 'Activity', 'Act unit']
+
+
+def _none(value):
+    return None if pd.isna(value) else value
+
+
+# template of a mapping (one row per stream) as a JSON-serializable dict
+def template_from_mapping(name, mapping):
+    mapping = mapping.reindex(columns=TEMPLATE_FIELDS)
+    streams = [{field: _none(row[field]) for field in TEMPLATE_FIELDS} for row in mapping.to_dict('records')]
+    return {'name': name, 'streams': streams}
+
+
+def mapping_from_template(template):
+    return pd.DataFrame(template['streams'], columns=TEMPLATE_FIELDS).astype(object)
+
+
+def read_template(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_template(path, template):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(template, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# folder of templates, one JSON file per template
+class TemplateStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, re.sub(r'[^\w\-. ]', '_', name).strip() + '.json')
+
+    def names(self):
+        names = []
+        for file in sorted(os.listdir(self.directory)):
+            if file.endswith('.json'):
+                try:
+                    names.append(read_template(os.path.join(self.directory, file))['name'])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return names
+
+    def save(self, name, mapping):
+        write_template(self._path(name), template_from_mapping(name, mapping))
+
+    # mapping of the template (columns of TEMPLATE_FIELDS), or None if there is no such template
+    def load(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        return mapping_from_template(read_template(path))
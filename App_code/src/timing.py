@@ -0,0 +1,36 @@
+# wall-clock timings of named stages, reported at startup
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('aspen-x-bw')
+
+# the timings are measured from the import of this module, i.e. from the start of the app
+START = time.perf_counter()
+
+_stages = []
+_lock = threading.Lock()
+
+
+def record(name, seconds):
+    with _lock:
+        _stages.append((name, time.perf_counter() - START, seconds))
+
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+# table of the recorded stages: when they ended (since the start of the app) and how long they took
+def startup_report():
+    with _lock:
+        stages = list(_stages)
+    lines = [f"{'stage':<40} {'end [s]':>9} {'duration [s]':>13}"]
+    lines += [f'{name:<40} {end:>9.3f} {seconds:>13.3f}' for name, end, seconds in stages]
+    return '\n'.join(lines)
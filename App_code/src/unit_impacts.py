@@ -0,0 +1,44 @@
+# characterized cradle-to-gate scores of one unit of every background activity, for every method
+import os
+
+import numpy as np
+
+
+# (activities x methods) table: since the foreground is a linear combination of background activities,
+# the score of a mapped stream is its amount times a row of the table
+class UnitImpactTable:
+    def __init__(self, product_ids, impacts):
+        self.product_ids = np.asarray(product_ids)
+        self.impacts = impacts
+        self.row_index = {int(act_id): i for i, act_id in enumerate(self.product_ids)}
+
+    # all the rows at once with the transposed system A^T X = (Q B)^T, one right-hand side per method
+    @classmethod
+    def compute(cls, prepared):
+        rhs = prepared.direct_impacts.T.toarray()
+        with prepared.lock:
+            impacts = prepared.solver.solve(rhs, trans='T')
+        return cls(prepared.product_ids, impacts)
+
+    def covers(self, activity_ids):
+        return all(int(act_id) in self.row_index for act_id in activity_ids)
+
+    # (exchanges x methods) scores of the given amounts of activities
+    def scores(self, activity_ids, amounts):
+        rows = [self.row_index[int(act_id)] for act_id in activity_ids]
+        return np.asarray(amounts, dtype=float)[:, None] * self.impacts[rows]
+
+    def save(self, prefix):
+        for name, array in (('ids', self.product_ids), ('impacts', np.asarray(self.impacts))):
+            tmp_path = f'{prefix}-{name}.{os.getpid()}.tmp.npy'
+            np.save(tmp_path, array)
+            os.replace(tmp_path, f'{prefix}-{name}.npy')
+
+    # the table is memory-mapped, so only the rows that are looked up are read from disk
+    @classmethod
+    def load(cls, prefix):
+        return cls(np.load(f'{prefix}-ids.npy'), np.load(f'{prefix}-impacts.npy', mmap_mode='r'))
+
+    @staticmethod
+    def exists(prefix):
+        return os.path.exists(f'{prefix}-ids.npy') and os.path.exists(f'{prefix}-impacts.npy')
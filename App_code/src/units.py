@@ -0,0 +1,152 @@
+# unit registry from Aspen Plus flow units to brightway activity units, and vectorized flow amounts
+import numpy as np
+import pandas as pd
+
+# Aspen rates -> (dimension, factor to the base unit of the dimension):
+# mass kg/hr, volume m3/hr, energy MJ/hr (duties and powers), amount kmol/hr
+ASPEN_UNITS = {
+    # mass flows
+    'kg/hr': ('mass', 1.0),
+    'kg/h': ('mass', 1.0),
+    'kg/min': ('mass', 60.0),
+    'kg/sec': ('mass', 3600.0),
+    'kg/s': ('mass', 3600.0),
+    'kg/day': ('mass', 1 / 24),
+    'g/hr': ('mass', 1e-3),
+    'g/sec': ('mass', 3.6),
+    'g/s': ('mass', 3.6),
+    'gm/sec': ('mass', 3.6),
+    'lb/hr': ('mass', 0.45359237),
+    'lb/sec': ('mass', 0.45359237 * 3600),
+    'lb/day': ('mass', 0.45359237 / 24),
+    'tonne/hr': ('mass', 1000.0),
+    'tonne/day': ('mass', 1000 / 24),
+    'tonne/year': ('mass', 1000 / (365 * 24)),
+    'ton/hr': ('mass', 907.18474),
+    'ton/day': ('mass', 907.18474 / 24),
+    'ton/year': ('mass', 907.18474 / (365 * 24)),
+    'kta': ('mass', 1e6 / (365 * 24)),
+    # volume flows
+    'cum/hr': ('volume', 1.0),
+    'm3/hr': ('volume', 1.0),
+    'm3/h': ('volume', 1.0),
+    'cum/sec': ('volume', 3600.0),
+    'm3/s': ('volume', 3600.0),
+    'cum/day': ('volume', 1 / 24),
+    'l/min': ('volume', 0.001 * 60),
+    'l/hr': ('volume', 0.001),
+    'l/sec': ('volume', 3.6),
+    'l/s': ('volume', 3.6),
+    'cuft/hr': ('volume', 0.028316846592),
+    'cuft/min': ('volume', 0.028316846592 * 60),
+    'gal/min': ('volume', 0.003785411784 * 60),
+    'gal/hr': ('volume', 0.003785411784),
+    'bbl/day': ('volume', 0.158987294928 / 24),
+    # energy flows and powers
+    'mj/hr': ('energy', 1.0),
+    'mj/h': ('energy', 1.0),
+    'kj/hr': ('energy', 1e-3),
+    'kj/sec': ('energy', 3.6),
+    'gj/hr': ('energy', 1000.0),
+    'w': ('energy', 0.0036),
+    'watt': ('energy', 0.0036),
+    'kw': ('energy', 3.6),
+    'mw': ('energy', 3600.0),
+    'cal/sec': ('energy', 4.1868e-6 * 3600),
+    'kcal/hr': ('energy', 4.1868e-3),
+    'mmkcal/hr': ('energy', 4186.8),
+    'gcal/hr': ('energy', 4186.8),
+    'btu/hr': ('energy', 1.05505585262e-3),
+    'mmbtu/hr': ('energy', 1055.05585262),
+    'hp': ('energy', 745.69987158 * 3600 / 1e6),
+    # molar flows
+    'kmol/hr': ('amount', 1.0),
+    'kmol/sec': ('amount', 3600.0),
+    'mol/hr': ('amount', 1e-3),
+    'mol/sec': ('amount', 3.6),
+    'mol/s': ('amount', 3.6),
+    'lbmol/hr': ('amount', 0.45359237),
+}
+
+# brightway activity units -> (dimension, size of the unit in the base unit of the dimension)
+BRIGHTWAY_UNITS = {
+    'kilogram': ('mass', 1.0),
+    'gram': ('mass', 1e-3),
+    'ton': ('mass', 1000.0),
+    'cubic meter': ('volume', 1.0),
+    'litre': ('volume', 1e-3),
+    'liter': ('volume', 1e-3),
+    'megajoule': ('energy', 1.0),
+    'kilojoule': ('energy', 1e-3),
+    'gigajoule': ('energy', 1000.0),
+    'kilowatt hour': ('energy', 3.6),
+    'megawatt hour': ('energy', 3600.0),
+    'kilomole': ('amount', 1.0),
+    'mole': ('amount', 1e-3),
+}
+
+# column of the flow tables holding each dimension
+FLOW_COLUMNS = {
+    'mass': 'Mass Flows',
+    'volume': 'Volume Flow',
+    'energy': 'Duty',
+    'amount': 'Mole Flows',
+}
+
+# dimension expected for each row of the Aspen tables
+COLUMN_DIMENSIONS = {
+    'Mass Flows': 'mass',
+    'Mass flow': 'mass',
+    'Volume Flow': 'volume',
+    'Duty': 'energy',
+    'Mole Flows': 'amount',
+}
+
+
+class UnitError(ValueError):
+    pass
+
+
+def aspen_unit(unit):
+    key = ' '.join(str(unit).split()).lower()
+    if key not in ASPEN_UNITS:
+        raise UnitError(f"Unknown Aspen unit '{unit}'")
+    return ASPEN_UNITS[key]
+
+
+# flow table converted to the base units, checking that each row has a unit of the right dimension
+def convert_flows(flows, units):
+    flows = flows.copy()
+    for column, dimension in COLUMN_DIMENSIONS.items():
+        if column not in flows or units.get(column) is None:
+            continue
+        unit_dimension, factor = aspen_unit(units[column])
+        if unit_dimension != dimension:
+            raise UnitError(f"'{column}' is in {units[column]}, which is not a unit of {dimension}")
+        flows[column] = flows[column] * factor
+    return flows
+
+
+# column of the flow tables used for an activity unit, or None if it has no flow column
+def flow_column(unit):
+    if unit not in BRIGHTWAY_UNITS:
+        return None
+    return FLOW_COLUMNS[BRIGHTWAY_UNITS[unit][0]]
+
+
+# amounts of the activities per unit of reference flow, for whole columns at once:
+# the flow column is picked by the dimension of the activity unit, then scaled to the unit and the reference flow.
+# Activities without a unit, or with a unit that has no flow in the Aspen tables, get 0
+def flow_amounts(df, ref_mass_flow):
+    dimensions = df['Act unit'].map({unit: dimension for unit, (dimension, _) in BRIGHTWAY_UNITS.items()})
+    sizes = df['Act unit'].map({unit: size for unit, (_, size) in BRIGHTWAY_UNITS.items()}).astype(float)
+
+    conditions, choices = [], []
+    for dimension, column in FLOW_COLUMNS.items():
+        if column in df:
+            conditions.append((dimensions == dimension).to_numpy())
+            choices.append(pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float))
+    values = np.select(conditions, choices, default=np.nan) if conditions else np.full(len(df), np.nan)
+
+    amounts = values / sizes.to_numpy() / ref_mass_flow
+    return pd.Series(np.nan_to_num(amounts, nan=0.0), index=df.index)
@@ -0,0 +1,115 @@
+# Aspen exports written in a watched folder of the server (config.WATCH_DIR), read again each time Aspen writes a new
+# one. The newest materials export (and the newest utilities export, which is optional) is used: files are told apart
+# by their name (Materials..., Utilities...). A file modified less than SETTLE_SECONDS ago may still be being written
+# and is only read at a later poll
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from aspen_io import read_material_table, read_utility_table
+from pipeline import UTILITY_COLUMNS, material_streams, utility_streams
+from timing import logger
+
+EXPORT_EXTENSIONS = ('.xlsx', '.xlsm', '.csv', '.parquet')
+# start of the (lower case) file name of each kind of export
+EXPORT_PREFIXES = {'materials': 'material', 'utilities': 'utilit'}
+SETTLE_SECONDS = 2
+
+# flows compared between two versions of the streams
+FLOW_COLUMNS = ['Mass Flows', 'Volume Flow', 'Mole Flows', 'Duty']
+
+# streams of one version of the exports. version hashes the contents of the files: an export written again with the
+# same content keeps its version. error is the message of an export that could not be read (streams are then None)
+WatchedExport = namedtuple('WatchedExport', ['version', 'files', 'in_df', 'out_df', 'util_df', 'error'])
+
+
+# one table of the input, output and utility streams, with their kind, to compare two versions of the exports
+def stream_table(in_df, out_df, util_df):
+    frames = [df.assign(Stream=kind) for kind, df in (('Input', in_df), ('Output', out_df), ('Utility', util_df))
+              if df is not None and len(df)]
+    if not frames:
+        return pd.DataFrame(columns=['Stream Name', 'Stream'] + FLOW_COLUMNS)
+    return pd.concat(frames).reindex(columns=['Stream Name', 'Stream'] + FLOW_COLUMNS).reset_index(drop=True)
+
+
+# names of the streams added, removed and changed (other kind or flows) from previous to current (see stream_table)
+def diff_streams(previous, current):
+    previous = previous.drop_duplicates('Stream Name').set_index('Stream Name')
+    current = current.drop_duplicates('Stream Name').set_index('Stream Name')
+    added = [name for name in current.index if name not in previous.index]
+    removed = [name for name in previous.index if name not in current.index]
+    common = [name for name in current.index if name in previous.index]
+    before = previous.loc[common, FLOW_COLUMNS].astype(float).to_numpy()
+    after = current.loc[common, FLOW_COLUMNS].astype(float).to_numpy()
+    same = np.isclose(before, after, rtol=1e-9, atol=0, equal_nan=True).all(axis=1)
+    same &= (previous.loc[common, 'Stream'].to_numpy() == current.loc[common, 'Stream'].to_numpy())
+    changed = [name for name, unchanged in zip(common, same) if not unchanged]
+    return added, removed, changed
+
+
+def diff_message(added, removed, changed):
+    parts = [f'{len(names)} stream(s) {what}' for what, names in (('changed', changed), ('added', added),
+                                                                  ('removed', removed)) if names]
+    return ', '.join(parts) if parts else 'no stream changed'
+
+
+class WatchFolder:
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._files = None
+        self._export = None
+        os.makedirs(directory, exist_ok=True)
+
+    def reset_locks(self):
+        self._lock = threading.Lock()
+
+    # (path, modification time, size) of the newest export of each kind, None if a file may still be being written
+    def _scan(self):
+        newest = dict.fromkeys(EXPORT_PREFIXES)
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                name = entry.name.lower()
+                if not name.endswith(EXPORT_EXTENSIONS) or name.startswith(('~$', '.')) or not entry.is_file():
+                    continue
+                for kind, prefix in EXPORT_PREFIXES.items():
+                    if name.startswith(prefix):
+                        stat = entry.stat()
+                        if newest[kind] is None or stat.st_mtime_ns > newest[kind][1]:
+                            newest[kind] = (entry.path, stat.st_mtime_ns, stat.st_size)
+        if any(file is not None and time.time() - file[1] / 1e9 < SETTLE_SECONDS for file in newest.values()):
+            return None
+        return newest
+
+    def _read(self, files):
+        contents = {}
+        for kind, file in files.items():
+            if file is not None:
+                with open(file[0], 'rb') as f:
+                    contents[kind] = f.read()
+        version = hashlib.sha1(b''.join(hashlib.sha1(content).digest() for content in contents.values())).hexdigest()
+        names = {kind: os.path.basename(file[0]) for kind, file in files.items() if file is not None}
+        try:
+            in_df, out_df = material_streams(read_material_table(contents['materials'], names['materials']))
+            if 'utilities' in contents:
+                util_df = utility_streams(read_utility_table(contents['utilities'], names['utilities']))
+            else:
+                util_df = pd.DataFrame(columns=UTILITY_COLUMNS)
+        except Exception as e:
+            logger.warning('Watched exports %s not read', ', '.join(names.values()), exc_info=True)
+            return WatchedExport(version, names, None, None, None, str(e) or type(e).__name__)
+        return WatchedExport(version, names, in_df, out_df, util_df, None)
+
+    # streams of the newest exports (WatchedExport), read once per new file; None while there is no materials export
+    def latest(self):
+        files = self._scan()
+        with self._lock:
+            if files is not None and files != self._files:
+                self._export = self._read(files) if files['materials'] is not None else None
+                self._files = files
+            return self._export